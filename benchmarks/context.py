@@ -0,0 +1,74 @@
+"""
+Stand-ins for the lightbulb contexts and Discord objects the sauce commands interact with
+"""
+import asyncio
+import itertools
+import typing as t
+from types import SimpleNamespace
+
+import hikari
+
+__all__ = ['FakeContext', 'fake_attachment', 'fake_message']
+
+
+_ids = itertools.count(100000000000000000)
+
+
+class FakeInteraction:
+    def __init__(self, context: 'FakeContext'):
+        self._context = context
+
+    async def edit_initial_response(self, *args, **kwargs) -> None:
+        await self._context.discord_call('edit', args, kwargs)
+
+
+class FakeContext:
+    """
+    Records every response instead of sending it to Discord, after an optional artificial delay
+    """
+
+    def __init__(self, *, command: str, guild_id: t.Optional[int], options: dict, discord_latency: float = 0.0):
+        self.command = SimpleNamespace(name=command)
+        self.guild_id = guild_id
+        self.author = SimpleNamespace(id=next(_ids), username="benchmark", mention="@benchmark")
+        self.options = SimpleNamespace(**options)
+        self.interaction = FakeInteraction(self)
+        self.responses = []  # type: t.List[t.Tuple[str, tuple, dict]]
+
+        self._guild = SimpleNamespace(id=guild_id, name=f"Guild {guild_id}") if guild_id else None
+        self._discord_latency = discord_latency
+
+    def get_guild(self):
+        return self._guild
+
+    async def respond(self, *args, **kwargs):
+        await self.discord_call('respond', args, kwargs)
+        return self
+
+    async def edit(self, *args, **kwargs):
+        await self.discord_call('edit', args, kwargs)
+
+    async def discord_call(self, kind: str, args: tuple, kwargs: dict) -> None:
+        if self._discord_latency:
+            await asyncio.sleep(self._discord_latency)
+        self.responses.append((kind, args, kwargs))
+
+
+def fake_attachment(url: str, filename: str) -> hikari.Attachment:
+    return hikari.Attachment(
+        id=hikari.Snowflake(next(_ids)),
+        url=url,
+        filename=filename,
+        media_type='image/jpeg',
+        size=1024,
+        proxy_url=url.replace('cdn.discordapp.com', 'media.discordapp.net'),
+        height=512,
+        width=512,
+        is_ephemeral=False,
+        duration=None,
+        waveform=None
+    )
+
+
+def fake_message(guild_id: t.Optional[int], attachments: t.List[hikari.Attachment]):
+    return SimpleNamespace(id=next(_ids), guild_id=guild_id, attachments=attachments, embeds=[])
@@ -0,0 +1,241 @@
+"""
+Local stand-ins for the SauceNao and AniList APIs, plus a static image host
+
+Responses are generated deterministically from the request, so the same image always produces the same result, and
+each service can be given artificial latency, random errors and SauceNao style rate limits.
+"""
+import asyncio
+import hashlib
+import random
+import time
+import typing as t
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import web
+
+__all__ = ['FakeSauceNao', 'FakeAniList', 'FakeImageHost', 'start_app']
+
+
+class _Behaviour:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 bandwidth: t.Optional[float] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.bandwidth = bandwidth
+        self.requests = 0
+        self.errors = 0
+        self.transferred = 0
+
+    async def delay(self) -> None:
+        self.requests += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def transfer(self, size: int) -> None:
+        """
+        Waits as long as sending the given number of bytes would take at the configured bandwidth, in bytes per second
+        """
+        self.transferred += size
+        if self.bandwidth:
+            await asyncio.sleep(size / self.bandwidth)
+
+    def should_fail(self) -> bool:
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+
+class FakeSauceNao(_Behaviour):
+    """
+    Mimics https://saucenao.com/search.php with output_type=2
+
+    Each API key gets short_limit searches per 30 seconds and long_limit per day. Roughly not_found_rate of images
+    return no results, and the rest resolve to a Pixiv, Danbooru or anime result depending on their hash.
+
+    With fetch enabled, images searched for by URL are downloaded from it first like SauceNao does, and uploaded
+    files take as long to arrive as the configured bandwidth allows.
+    """
+
+    def __init__(self, *, short_limit: int = 100, long_limit: int = 100000, not_found_rate: float = 0.1,
+                 fetch: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.short_limit = short_limit
+        self.long_limit = long_limit
+        self.not_found_rate = not_found_rate
+        self.fetch = fetch
+        self.rate_limited = 0
+        self.fetched = 0
+
+        self._short_windows = defaultdict(list)  # type: t.Dict[str, t.List[float]]
+        self._long_counts = defaultdict(int)  # type: t.Dict[str, int]
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post('/search.php', self.search)
+        return app
+
+    async def search(self, request: web.Request) -> web.Response:
+        await self.delay()
+
+        api_key = request.query.get('api_key', '')
+        if 'url' in request.query:
+            image_id = urlsplit(request.query['url']).path  # Ignore CDN signatures and the like
+            if self.fetch:
+                await self._fetch(request.query['url'])
+        else:
+            post = await request.post()
+            content = post['file'].file.read()
+            await self.transfer(len(content))
+            image_id = hashlib.sha1(content).hexdigest()
+
+        # Rate limits
+        now = time.monotonic()
+        window = [ts for ts in self._short_windows[api_key] if now - ts < 30]
+        self._short_windows[api_key] = window
+        if self._long_counts[api_key] >= self.long_limit:
+            self.rate_limited += 1
+            return self._error(429, "Daily Search Limit Exceeded. You can search again in 24 hours.")
+        if len(window) >= self.short_limit:
+            self.rate_limited += 1
+            return self._error(429, "Search Rate Too High. Your IP has exceeded the basic account type's rate limit of "
+                                    "4 searches every 30 seconds.")
+
+        if self.should_fail():
+            return web.Response(status=500, text="Internal Server Error")
+
+        window.append(now)
+        self._long_counts[api_key] += 1
+
+        header = {
+            'user_id': '1', 'account_type': '2',
+            'short_limit': str(self.short_limit), 'long_limit': str(self.long_limit),
+            'long_remaining': self.long_limit - self._long_counts[api_key],
+            'short_remaining': self.short_limit - len(window),
+            'status': 0, 'results_requested': 6, 'index': {}, 'search_depth': '128',
+            'minimum_similarity': 40.0, 'query_image_display': '', 'query_image': '', 'results_returned': 0
+        }
+
+        digest = int(hashlib.sha1(image_id.encode('utf-8')).hexdigest(), 16)
+        results = [] if (digest % 1000) / 1000 < self.not_found_rate else self._results(digest)
+        header['results_returned'] = len(results)
+
+        return web.json_response({'header': header, 'results': results})
+
+    async def _fetch(self, url: str) -> None:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                content = await response.read()
+
+        self.fetched += len(content)
+
+    @staticmethod
+    def _results(digest: int) -> t.List[dict]:
+        similarity = 60 + digest % 40
+        kind = digest % 3
+        thumbnail = f"https://img3.saucenao.com/fake/{digest % 100000}.jpg"
+
+        if kind == 0:
+            pixiv_id = digest % 100000000
+            return [{
+                'header': {'similarity': f"{similarity}.00", 'thumbnail': thumbnail, 'index_id': 5,
+                           'index_name': 'Index #5: Pixiv Images', 'dupes': 0, 'hidden': 0},
+                'data': {'ext_urls': [f"https://www.pixiv.net/member_illust.php?mode=medium&illust_id={pixiv_id}"],
+                         'title': f"Illustration {pixiv_id}", 'pixiv_id': pixiv_id,
+                         'member_name': f"Artist {digest % 1000}", 'member_id': digest % 1000}
+            }]
+
+        if kind == 1:
+            danbooru_id = digest % 10000000
+            return [{
+                'header': {'similarity': f"{similarity}.00", 'thumbnail': thumbnail, 'index_id': 9,
+                           'index_name': 'Index #9: Danbooru', 'dupes': 0, 'hidden': 0},
+                'data': {'ext_urls': [f"https://danbooru.donmai.us/post/show/{danbooru_id}"],
+                         'danbooru_id': danbooru_id, 'creator': f"artist_{digest % 1000}",
+                         'material': 'original', 'characters': f"character_{digest % 50}", 'source': ''}
+            }]
+
+        anidb_aid = digest % 500 + 1
+        return [{
+            'header': {'similarity': f"{similarity}.00", 'thumbnail': thumbnail, 'index_id': 21,
+                       'index_name': 'Index #21: Anime', 'dupes': 0, 'hidden': 0},
+            'data': {'ext_urls': [f"https://anidb.net/perl-bin/animedb.pl?show=anime&aid={anidb_aid}"],
+                     'source': f"Anime {anidb_aid}", 'anidb_aid': anidb_aid, 'part': str(digest % 24 + 1),
+                     'year': '2020', 'est_time': '00:12:34 / 00:24:00'}
+        }]
+
+    @staticmethod
+    def _error(status: int, message: str) -> web.Response:
+        return web.json_response({'header': {'status': 0, 'message': message}}, status=status)
+
+
+class FakeAniList(_Behaviour):
+    """
+    Mimics the AniList GraphQL endpoint for the Media query made by the AniList client
+    """
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/', self.graphql)
+        return app
+
+    async def graphql(self, request: web.Request) -> web.Response:
+        await self.delay()
+        if self.should_fail():
+            return web.Response(status=500, text="Internal Server Error")
+
+        anilist_id = int((await request.json())['variables']['id'])
+        return web.json_response({'data': {'Media': {
+            'description': f"<i>Anime {anilist_id}</i> is a show.<br><br><br><br>It has episodes.",
+            'coverImage': {'extraLarge': f"https://s4.anilist.co/file/fake/{anilist_id}.jpg"},
+            'genres': ['Action', 'Comedy'],
+            'startDate': {'year': 2020, 'month': anilist_id % 12 + 1, 'day': 1},
+            'rankings': [{'rank': anilist_id % 100 + 1}],
+            'averageScore': 50 + anilist_id % 50
+        }}})
+
+
+class FakeImageHost(_Behaviour):
+    """
+    Serves small, unique pseudo-images for any /images/{name} path, or Discord style attachment path
+
+    Real images can be served instead by name, as (content, content type) pairs, at the configured bandwidth
+    """
+
+    def __init__(self, *, images: t.Optional[t.Dict[str, t.Tuple[bytes, str]]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.images = images or {}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/images/{name}', self.image)
+        app.router.add_get('/attachments/{channel_id}/{attachment_id}/{name}', self.image)
+        return app
+
+    async def image(self, request: web.Request) -> web.Response:
+        await self.delay()
+        name = request.match_info['name']
+        if name in self.images:
+            body, content_type = self.images[name]
+            await self.transfer(len(body))
+            return web.Response(body=body, content_type=content_type)
+
+        body = b'\xff\xd8\xff\xe0' + hashlib.sha256(name.encode('utf-8')).digest() * 64
+        return web.Response(body=body, content_type='image/jpeg')
+
+
+async def start_app(app: web.Application, host: str = '127.0.0.1') -> t.Tuple[web.AppRunner, str]:
+    """
+    Starts an application on a random local port, returning its runner and base URL
+    """
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, 0)
+    await site.start()
+
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}"
@@ -0,0 +1,100 @@
+"""
+Microbenchmark for building and searching the near duplicate image index
+
+Fills an index with random 64 bit hashes, then searches it for near duplicates of stored hashes (a few bits flipped)
+and for hashes that aren't in it. Searches are compared against a brute force scan of every hash, which they should
+always agree with. Reopening the index from disk is timed too.
+
+Usage:
+    python -m benchmarks.hash_index --entries 1000000 --queries 2000
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from saucebot.components.hashindex import HashIndex, hamming_distances
+
+
+def percentile(values, pct: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def report(name: str, durations) -> None:
+    print(f"{name:<28}{percentile(durations, 50) * 1e6:>10.1f}{percentile(durations, 95) * 1e6:>10.1f}"
+          f"{percentile(durations, 99) * 1e6:>10.1f}")
+
+
+def flip(image_hash: int, bits: int) -> int:
+    for bit in random.sample(range(64), bits):
+        image_hash ^= 1 << bit
+    return image_hash
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--max-distance', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    hashes = [random.getrandbits(64) for _ in range(args.entries)]
+    workdir = tempfile.mkdtemp(prefix='saucebot-benchmark-')
+    path = f"{workdir}/near_duplicates.idx"
+
+    try:
+        index = HashIndex(path, max_distance=args.max_distance)
+        index.open()
+
+        started = time.perf_counter()
+        for i, image_hash in enumerate(hashes):
+            index.add(image_hash, f"content:{i:040x}")
+        added = time.perf_counter() - started
+
+        started = time.perf_counter()
+        index.flush()
+        index.rebuild()
+        built = time.perf_counter() - started
+
+        index.close()
+        started = time.perf_counter()
+        index.open()
+        opened = time.perf_counter() - started
+
+        print(f"\n{len(index)} entries, max distance {args.max_distance}, "
+              f"{len(index._probes)} buckets probed per block")
+        print(f"add: {added:.2f}s ({added / args.entries * 1e6:.2f} us each), rebuild: {built:.2f}s, "
+              f"reopen: {opened:.2f}s")
+
+        print(f"\n{'query':<28}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}")
+        stored = np.asarray(index._hashes[1:1 + len(index)])
+        durations = {'near duplicate': [], 'miss': [], 'brute force': []}
+        mismatches = 0
+        for _ in range(args.queries):
+            near = flip(random.choice(hashes), random.randint(0, args.max_distance))
+            for kind, query in (('near duplicate', near), ('miss', random.getrandbits(64))):
+                started = time.perf_counter()
+                found = index.search(query, limit=args.entries)
+                durations[kind].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                expected = np.count_nonzero(hamming_distances(stored, query) <= args.max_distance)
+                durations['brute force'].append(time.perf_counter() - started)
+                if index._informative(query) and len(found) != expected:
+                    mismatches += 1
+
+        for kind, values in durations.items():
+            report(kind, values)
+        print(f"\nSearches that disagreed with brute force: {mismatches}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+End-to-end load test for the sauce commands, run entirely against local stand-in services
+
+Starts fake SauceNao, AniList and image hosting servers, points a temporary config at them and an SQLite database,
+then fires a mix of `/sauce url`, `/sauce file` and message command invocations through the real command handlers
+with fake interaction contexts. Throughput and p50/p95/p99 latencies are reported for each stage of the lookup.
+
+Usage:
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.load --invocations 5000 --concurrency 500
+"""
+import argparse
+import asyncio
+import functools
+import os
+import pathlib
+import random
+import secrets
+import sys
+import tempfile
+import time
+import typing as t
+from collections import defaultdict, Counter
+
+import toml
+from sqlalchemy import BigInteger
+from sqlalchemy.ext.compiler import compiles
+
+from benchmarks.context import FakeContext, fake_attachment, fake_message
+from benchmarks.fakes import FakeSauceNao, FakeAniList, FakeImageHost, start_app
+
+REPO_ROOT = pathlib.Path(__file__).parent.parent.resolve()
+
+
+class StageTimer:
+    """
+    Collects the wall clock duration of every call to each instrumented stage
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(list)  # type: t.Dict[str, t.List[float]]
+        self.errors = defaultdict(Counter)  # type: t.Dict[str, t.Counter[str]]
+
+    def wrap(self, stage: str, func: t.Callable[..., t.Awaitable]) -> t.Callable[..., t.Awaitable]:
+        @functools.wraps(func)
+        async def _timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                self.errors[stage][type(e).__name__] += 1
+                raise
+            finally:
+                self.durations[stage].append(time.perf_counter() - started)
+
+        return _timed
+
+    def instrument(self, obj, attr: str, stage: str) -> None:
+        setattr(obj, attr, self.wrap(stage, getattr(obj, attr)))
+
+
+def percentile(values: t.List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def write_config(workdir: str, args: argparse.Namespace, urls: t.Dict[str, str]) -> None:
+    tokens = [secrets.token_hex(16) for _ in range(args.keys)]
+    config = {
+        'bot': {'in_dev': False, 'log_level': args.log_level, 'language': 'english'},
+        'discord': {'prod': {'token': 'benchmark'}, 'dev': {'token': 'benchmark'}},
+        'database': {'prod': {'url': f"sqlite+aiosqlite:///{workdir}/benchmark.db"},
+                     'dev': {'url': f"sqlite+aiosqlite:///{workdir}/benchmark.db"}},
+        'saucenao': {'token': tokens[0], 'tokens': tokens[1:], 'min_similarity': 60.0,
+                     'api_url': f"{urls['saucenao']}/search.php", 'queue_timeout': args.queue_timeout},
+        'anilist': {'api_url': f"{urls['anilist']}/"},
+        'cache': {'persistent': not args.no_persistent_cache},
+        'fair_share': {'default_budget': args.long_limit, 'min_daily': args.invocations},
+        'http': {'pool_size': args.pool_size, 'images': {'allow_private_addresses': True}},
+        'sentry': {'enabled': False, 'dsn': '', 'log_in_dev': False},
+    }
+
+    with open(os.path.join(workdir, 'config.toml'), 'w') as f:
+        toml.dump(config, f)
+
+
+def build_workload(args: argparse.Namespace) -> t.List[t.Tuple[str, t.Optional[int], int]]:
+    """
+    Builds a list of (command, guild_id, image) invocations
+
+    Images are drawn from a fixed pool so that repeat lookups exercise the caches, and every Discord attachment
+    URL gets a fresh CDN signature like it would in the wild
+    """
+    weights = dict(part.split('=') for part in args.mix.split(','))
+    commands = random.choices(list(weights), [float(w) for w in weights.values()], k=args.invocations)
+
+    workload = []
+    for command in commands:
+        guild_id = None if random.random() < args.dm_rate else random.randint(1, args.guilds)
+        image = random.randint(1, args.images)
+        workload.append((command, guild_id, image))
+
+    return workload
+
+
+def attachment_url(image: int) -> str:
+    signature = f"ex={secrets.token_hex(4)}&is={secrets.token_hex(4)}&hm={secrets.token_hex(32)}"
+    return f"https://cdn.discordapp.com/attachments/1000/{2000 + image}/image_{image}.png?{signature}"
+
+
+async def run(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+
+    # Start up the stand-in services
+    fakes = {
+        'saucenao': FakeSauceNao(latency=args.saucenao_latency, jitter=args.saucenao_latency / 2,
+                                 error_rate=args.error_rate, short_limit=args.short_limit,
+                                 long_limit=args.long_limit),
+        'anilist': FakeAniList(latency=args.anilist_latency, jitter=args.anilist_latency / 2,
+                               error_rate=args.error_rate),
+        'images': FakeImageHost(latency=args.image_latency)
+    }
+    runners, urls = [], {}
+    for name, fake in fakes.items():
+        runner, urls[name] = await start_app(fake.app())
+        runners.append(runner)
+
+    # The bot reads ./config.toml on import, so everything below has to be imported from inside the work directory
+    workdir = tempfile.mkdtemp(prefix='saucebot-benchmark-')
+    write_config(workdir, args, urls)
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+
+    import pysaucenao
+    import bot  # noqa: F401 - installs miru for the result views
+    from saucebot.components import images
+    from saucebot.components.clients import clients
+    from saucebot.extensions import sauce
+    from saucebot.models import async_engine
+    from saucebot.models.cache import CacheEntries
+    from saucebot.models.servers import Servers
+
+    # SQLite only autoincrements primary keys declared as INTEGER, and its INTEGER is 64 bits wide anyway
+    @compiles(BigInteger, 'sqlite')
+    def _sqlite_big_integer(type_, compiler, **kwargs):
+        return 'INTEGER'
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Servers.metadata.create_all)
+        await conn.run_sync(CacheEntries.metadata.create_all)
+
+    # AniDB ID mapping normally goes out to an external relations API
+    async def _load_ids(self):
+        self._ids = {'anilist': self.anidb_id, 'myanimelist': self.anidb_id}
+    pysaucenao.AnimeSource.load_ids = _load_ids
+
+    # Attachments are downloaded to key them by their content, from the fake image host rather than Discord's CDN
+    fetch_image = images.fetch
+
+    async def _fetch_attachment(url: str) -> bytes:
+        return await fetch_image(url.replace("https://cdn.discordapp.com", urls['images'], 1))
+    images.fetch = _fetch_attachment
+
+    timer = StageTimer()
+    timer.instrument(sauce, '_command_init', 'defer')
+    timer.instrument(sauce, 'cache_key', 'cache_key')
+    timer.instrument(Servers, 'get_api_key', 'api_key')
+    timer.instrument(sauce, '_search', 'saucenao')
+    timer.instrument(pysaucenao.AnimeSource, 'load_ids', 'load_ids')
+    timer.instrument(sauce, '_get_anilist', 'anilist')
+    timer.instrument(sauce, '_build_sauce_embed', 'build_embed')
+    timer.instrument(FakeContext, 'respond', 'respond')
+
+    await clients.start()
+    await sauce.on_starting(None)
+
+    workload = build_workload(args)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    outcomes = Counter()
+
+    async def invoke(command: str, guild_id: t.Optional[int], image: int) -> None:
+        if command == 'url':
+            if image % 2:
+                options = {'image_url': attachment_url(image)}
+            else:
+                options = {'image_url': f"{urls['images']}/images/{image}.jpg"}
+            handler = sauce.sauce_url
+        elif command == 'file':
+            options = {'image': fake_attachment(attachment_url(image), f"image_{image}.png")}
+            handler = sauce.sauce_file
+        else:
+            attachment = fake_attachment(attachment_url(image), f"image_{image}.png")
+            options = {'target': fake_message(guild_id, [attachment])}
+            handler = sauce.message_sauce
+
+        ctx = FakeContext(command=command, guild_id=guild_id, options=options, discord_latency=args.discord_latency)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await handler.callback(ctx)
+                outcomes['ok'] += 1
+            except Exception as e:
+                outcomes[type(e).__name__] += 1
+            finally:
+                timer.durations[f'total ({command})'].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(invoke(*invocation) for invocation in workload))
+    elapsed = time.perf_counter() - started
+
+    await sauce.on_stopping(None)
+    await Servers.flush_queries()
+    await clients.close()
+    for runner in runners:
+        await runner.cleanup()
+
+    # Report
+    print(f"\n{len(workload)} invocations in {elapsed:.2f}s ({len(workload) / elapsed:.1f}/s), "
+          f"concurrency {args.concurrency}")
+    print("Outcomes: " + ", ".join(f"{name}={count}" for name, count in outcomes.most_common()))
+    print("Upstream requests: " + ", ".join(
+        f"{name}={fake.requests}" for name, fake in fakes.items()
+    ) + f", saucenao rate limited={fakes['saucenao'].rate_limited}")
+
+    print(f"\n{'stage':<20}{'calls':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  errors")
+    for stage, durations in timer.durations.items():
+        errors = ", ".join(f"{name}={count}" for name, count in timer.errors[stage].items())
+        print(f"{stage:<20}{len(durations):>8}"
+              f"{percentile(durations, 50) * 1000:>10.1f}"
+              f"{percentile(durations, 95) * 1000:>10.1f}"
+              f"{percentile(durations, 99) * 1000:>10.1f}  {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invocations', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--mix', default='url=0.3,file=0.2,message=0.5',
+                        help="Relative weights of the url, file and message commands")
+    parser.add_argument('--images', type=int, default=500, help="Number of distinct images to look up")
+    parser.add_argument('--guilds', type=int, default=50)
+    parser.add_argument('--dm-rate', type=float, default=0.1)
+    parser.add_argument('--keys', type=int, default=2, help="Number of public SauceNao API keys")
+    parser.add_argument('--short-limit', type=int, default=200, help="SauceNao searches per key per 30 seconds")
+    parser.add_argument('--long-limit', type=int, default=100000, help="SauceNao searches per key per day")
+    parser.add_argument('--saucenao-latency', type=float, default=0.3)
+    parser.add_argument('--anilist-latency', type=float, default=0.1)
+    parser.add_argument('--image-latency', type=float, default=0.05)
+    parser.add_argument('--discord-latency', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--queue-timeout', type=float, default=60.0)
+    parser.add_argument('--pool-size', type=int, default=100)
+    parser.add_argument('--no-persistent-cache', action='store_true')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--seed', type=int, default=1)
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
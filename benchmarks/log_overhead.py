@@ -0,0 +1,83 @@
+"""
+Microbenchmark for the per-call overhead of saucebot.components.log
+
+Compares the old inspect.stack() based logger lookup against the current one, both for messages below the log
+level (which should cost next to nothing) and for messages that are actually written out. Each is called the way
+its call sites call it: the old one with a message already built from an f-string, the current one with %-style
+args that are only applied if the record is written out.
+
+Usage:
+    python -m benchmarks.log_overhead --calls 20000
+"""
+import argparse
+import inspect
+import logging
+import timeit
+
+from saucebot.components import log
+from saucebot.components.helpers import make_utf8_safe
+
+
+def _old_get_module():
+    stack = inspect.stack()[1]
+    return inspect.getmodule(stack[0])
+
+
+def old_debug(message: str, guild=None, **kwargs):
+    """
+    The previous implementation of log.debug, kept here for comparison
+    """
+    if isinstance(guild, int):
+        message = f"[{guild}] {message}"
+    return logging.getLogger(_old_get_module().__name__).debug(make_utf8_safe(message), **kwargs)
+
+
+def old_cache_hit(url: str, key: str) -> None:
+    old_debug(f"Cache hit: {url} ({key})", 1234)
+
+
+def cache_hit(url: str, key: str) -> None:
+    log.debug("Cache hit: %s (%s)", 1234, url, key)
+
+
+def lookup(debug, depth: int) -> None:
+    """
+    Logs from a few frames deep, roughly where the sauce commands log from inside of the event loop
+    """
+    if depth:
+        return lookup(debug, depth - 1)
+
+    debug("https://cdn.discordapp.com/attachments/1/2/image.png", "attachment:0123456789abcdef")
+
+
+def measure(debug, calls: int, depth: int) -> float:
+    seconds = min(timeit.repeat(lambda: lookup(debug, depth), number=calls, repeat=3))
+    return seconds / calls * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--depth', type=int, default=20, help="Stack depth to log from")
+    args = parser.parse_args()
+
+    # Emitted records go to a null stream, so we only measure our own overhead and not the terminal
+    handler = logging.StreamHandler(open('/dev/null', 'w'))
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logging.getLogger().addHandler(handler)
+
+    print(f"{'':<28}{'before (us/call)':>18}{'after (us/call)':>18}")
+    for label, level in (("debug disabled", logging.INFO), ("debug enabled", logging.DEBUG)):
+        logging.getLogger().setLevel(level)
+        before = measure(old_cache_hit, args.calls, args.depth)
+        after = measure(cache_hit, args.calls, args.depth)
+        print(f"{label:<28}{before:>18.2f}{after:>18.2f}")
+
+    log.start_queue()
+    after = measure(cache_hit, args.calls, args.depth)
+    log.stop_queue()
+    print(f"{'debug enabled, queued':<28}{'':>18}{after:>18.2f}")
+
+
+if __name__ == '__main__':
+    main()
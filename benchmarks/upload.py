@@ -0,0 +1,161 @@
+"""
+Compares having SauceNao fetch images from their links against downloading, shrinking and uploading them ourselves
+
+Generates a set of real images, serves them from a fake image host, and looks each of them up against a fake SauceNao
+in both modes. In URL mode SauceNao downloads the full image from the host itself. In upload mode the bot downloads
+it, shrinks it down in the image worker pool and uploads the result at the configured upload bandwidth. Bytes sent to
+SauceNao and p50/p95/p99 latencies are reported for each mode.
+
+Usage:
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.upload --images 50 --width 2400 --height 1800 --format PNG
+"""
+import argparse
+import asyncio
+import io
+import os
+import pathlib
+import random
+import secrets
+import sys
+import tempfile
+import time
+import typing as t
+
+import toml
+from PIL import Image
+
+from benchmarks.fakes import FakeSauceNao, FakeImageHost, start_app
+from benchmarks.load import percentile
+
+REPO_ROOT = pathlib.Path(__file__).parent.parent.resolve()
+
+
+def make_image(args: argparse.Namespace, seed: int) -> t.Tuple[bytes, str]:
+    """
+    Draws a noisy gradient, which compresses about as well as a typical illustration
+    """
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize((args.width, args.height))
+    noise = Image.effect_noise((args.width, args.height), rng.uniform(20, 60))
+    image = Image.merge('RGB', (gradient, noise, gradient.rotate(rng.randint(0, 359))))
+
+    output = io.BytesIO()
+    image.save(output, format=args.format)
+    return output.getvalue(), Image.MIME[args.format]
+
+
+def write_config(workdir: str, args: argparse.Namespace, saucenao_url: str) -> None:
+    config = {
+        'bot': {'in_dev': False, 'log_level': args.log_level, 'language': 'english'},
+        'discord': {'prod': {'token': 'benchmark'}, 'dev': {'token': 'benchmark'}},
+        'database': {'prod': {'url': f"sqlite+aiosqlite:///{workdir}/benchmark.db"},
+                     'dev': {'url': f"sqlite+aiosqlite:///{workdir}/benchmark.db"}},
+        'saucenao': {'token': secrets.token_hex(16), 'min_similarity': 60.0, 'api_url': f"{saucenao_url}/search.php"},
+        'upload': {'enabled': True, 'max_dimension': args.max_dimension, 'workers': args.workers},
+        'http': {'images': {'allow_private_addresses': True}},
+        'sentry': {'enabled': False, 'dsn': '', 'log_in_dev': False},
+    }
+
+    with open(os.path.join(workdir, 'config.toml'), 'w') as f:
+        toml.dump(config, f)
+
+
+async def run(args: argparse.Namespace) -> None:
+    random.seed(args.seed)
+
+    print(f"Generating {args.images} {args.width}x{args.height} {args.format} images")
+    images = {f"{i}.{args.format.lower()}": make_image(args, i) for i in range(args.images)}
+    total_size = sum(len(content) for content, _ in images.values())
+
+    host = FakeImageHost(images=images, latency=args.image_latency, bandwidth=args.host_bandwidth)
+    saucenao = FakeSauceNao(latency=args.saucenao_latency, bandwidth=args.upload_bandwidth, fetch=True,
+                            short_limit=args.images * 10)
+    runners, urls = [], {}
+    for name, fake in (('images', host), ('saucenao', saucenao)):
+        runner, urls[name] = await start_app(fake.app())
+        runners.append(runner)
+
+    # The bot reads ./config.toml on import, so everything below has to be imported from inside the work directory
+    workdir = tempfile.mkdtemp(prefix='saucebot-benchmark-')
+    write_config(workdir, args, urls['saucenao'])
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+
+    from saucebot.components import images as bot_images
+    from saucebot.components.clients import clients
+    from saucebot.components.config import config
+
+    await clients.start()
+    client = clients.saucenao(config["saucenao"]["token"])
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def by_url(url: str) -> None:
+        await client.from_url(url)
+
+    normalize_durations = []
+
+    async def by_upload(url: str) -> None:
+        original = await bot_images.fetch(url)
+        started = time.perf_counter()
+        data, _ = await asyncio.get_running_loop().run_in_executor(bot_images._executor, bot_images.normalize,
+                                                                   original)
+        normalize_durations.append(time.perf_counter() - started)
+        await client.from_file(data)
+
+    print(f"Total image size: {total_size / 1024:.0f} KiB\n")
+    print(f"{'mode':<10}{'elapsed s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'to saucenao KiB':>18}"
+          f"{'from host KiB':>16}")
+    for mode, lookup in (('url', by_url), ('upload', by_upload)):
+        durations = []
+        saucenao_before, host_before = saucenao.transferred + saucenao.fetched, host.transferred
+
+        async def timed(name: str) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                await lookup(f"{urls['images']}/images/{name}")
+                durations.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(timed(name) for name in images))
+        elapsed = time.perf_counter() - started
+
+        # In URL mode SauceNao pulls the whole image from the host, in upload mode we push the shrunken copy to it
+        to_saucenao = saucenao.transferred + saucenao.fetched - saucenao_before
+        print(f"{mode:<10}{elapsed:>10.2f}"
+              f"{percentile(durations, 50) * 1000:>10.1f}"
+              f"{percentile(durations, 95) * 1000:>10.1f}"
+              f"{percentile(durations, 99) * 1000:>10.1f}"
+              f"{to_saucenao / 1024:>18.0f}{(host.transferred - host_before) / 1024:>16.0f}")
+
+    print(f"\nnormalize p50 {percentile(normalize_durations, 50) * 1000:.1f} ms, "
+          f"p95 {percentile(normalize_durations, 95) * 1000:.1f} ms on {args.workers} workers")
+
+    await clients.close()
+    bot_images.shutdown()
+    for runner in runners:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--width', type=int, default=2400)
+    parser.add_argument('--height', type=int, default=1800)
+    parser.add_argument('--format', default='PNG', choices=['PNG', 'JPEG', 'WEBP'])
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--max-dimension', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--host-bandwidth', type=float, default=50e6,
+                        help="Bytes per second the image host serves each request at")
+    parser.add_argument('--upload-bandwidth', type=float, default=5e6,
+                        help="Bytes per second uploads reach SauceNao at")
+    parser.add_argument('--saucenao-latency', type=float, default=0.3)
+    parser.add_argument('--image-latency', type=float, default=0.05)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
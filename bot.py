@@ -3,12 +3,26 @@ import lightbulb
 import miru
 from lightbulb.ext import tasks
 
+from saucebot.components import log
 from saucebot.components.config import config
 
 __all__ = ['bot']
 
 _token = config["discord"]["dev"]["token"] if config["bot"]["in_dev"] else config["discord"]["prod"]["token"]
-bot = lightbulb.BotApp(_token, intents=hikari.Intents.ALL_UNPRIVILEGED, logs=config['bot']['log_level'])
+
+# Every command is an interaction, which don't need any intents. In lean mode the only gateway events we ask for are
+# guild updates, and only guilds and roles are cached, for get_guild() and lightbulb's permission checks
+if config["bot"].get("lean", False):
+    _intents = hikari.Intents.GUILDS
+    _cache_settings = hikari.impl.CacheSettings(
+        components=hikari.api.CacheComponents.GUILDS | hikari.api.CacheComponents.ROLES
+    )
+else:
+    _intents = hikari.Intents.ALL_UNPRIVILEGED
+    _cache_settings = None
+
+bot = lightbulb.BotApp(_token, intents=_intents, cache_settings=_cache_settings, logs=config['bot']['log_level'])
+log.start_queue()  # Hand the logging handlers set up above off to a background thread
 
 
 # Extensions
@@ -0,0 +1,283 @@
+"""
+Runs the bot as a cluster of worker processes, each owning a contiguous range of gateway shards
+
+The supervisor restarts workers that crash, relays messages between them (such as settings changes, so every worker
+drops its cached copy) and aggregates the health they report.
+
+Usage:
+    python cluster.py [--workers N] [--shards N]
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import signal
+import threading
+import time
+import typing as t
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Connection, wait
+
+from saucebot.components.config import config
+
+log = logging.getLogger('saucebot.cluster')
+
+cluster_config = config.get("cluster", {})
+
+
+def _run_worker(conn: Connection, worker_id: int, worker_count: int, shard_ids: t.List[int], shard_count: int):
+    """
+    Entry point for worker processes
+    """
+    from saucebot.components import cluster
+    cluster.attach(conn, worker_id, worker_count)
+
+    import main
+    main.run(shard_ids=shard_ids, shard_count=shard_count)
+
+
+class Worker:
+    def __init__(self, worker_id: int, shard_ids: t.List[int]):
+        self.worker_id = worker_id
+        self.shard_ids = shard_ids
+        self.process = None  # type: t.Optional[multiprocessing.Process]
+        self.conn = None  # type: t.Optional[Connection]
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_at = 0.0
+        self.health = {}  # type: dict
+        self.health_at = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return bool(self.process and self.process.is_alive())
+
+
+class Supervisor:
+    """
+    Starts and watches over the cluster workers
+    """
+
+    def __init__(self, worker_count: int, shard_count: int):
+        self.shard_count = shard_count
+        self.workers = [Worker(i, shard_ids) for i, shard_ids in enumerate(shard_ranges(shard_count, worker_count))]
+
+        self.backoff = float(cluster_config.get("restart_backoff", 5.0))
+        self.max_backoff = float(cluster_config.get("max_restart_backoff", 300.0))
+        self.health_interval = float(cluster_config.get("health_interval", 60.0))
+        self._context = multiprocessing.get_context('spawn')
+        self._stopping = False
+
+    def run(self) -> None:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self.stop())
+
+        for worker in self.workers:
+            self.spawn(worker)
+
+        last_report = time.monotonic()
+        while not self._stopping:
+            self.poll()
+
+            if time.monotonic() - last_report >= self.health_interval:
+                last_report = time.monotonic()
+                self.log_health()
+
+        self.shutdown()
+
+    def spawn(self, worker: Worker) -> None:
+        parent_conn, child_conn = self._context.Pipe()
+        worker.conn = parent_conn
+        worker.process = self._context.Process(
+            target=_run_worker,
+            args=(child_conn, worker.worker_id, len(self.workers), worker.shard_ids, self.shard_count),
+            name=f"saucebot-worker-{worker.worker_id}"
+        )
+        worker.process.start()
+        child_conn.close()
+        worker.started_at = time.monotonic()
+        worker.health = {}
+
+        log.info(f"Started worker {worker.worker_id} (pid {worker.process.pid}) "
+                 f"for shards {worker.shard_ids[0]}-{worker.shard_ids[-1]}")
+
+    def poll(self) -> None:
+        """
+        Handles messages from the workers, and restarts any that have exited
+        """
+        conns = {worker.conn: worker for worker in self.workers if worker.conn}
+        sentinels = {worker.process.sentinel: worker for worker in self.workers if worker.alive}
+        for ready in wait([*conns, *sentinels], timeout=1.0):
+            if ready in conns:
+                self.receive(conns[ready])
+
+        now = time.monotonic()
+        for worker in self.workers:
+            if self._stopping or worker.alive:
+                continue
+
+            if not worker.restart_at:
+                # Crash loops are backed off exponentially, but a worker that ran for a while starts over again
+                if now - worker.started_at > self.max_backoff:
+                    worker.restarts = 0
+                delay = min(self.backoff * 2 ** worker.restarts, self.max_backoff)
+                worker.restart_at = now + delay
+                log.error(f"Worker {worker.worker_id} exited with code {worker.process.exitcode}, "
+                          f"restarting in {delay:.0f} seconds")
+
+            if now >= worker.restart_at:
+                worker.restarts += 1
+                worker.restart_at = 0.0
+                self.spawn(worker)
+
+    def receive(self, worker: Worker) -> None:
+        try:
+            message = worker.conn.recv()
+        except (OSError, EOFError):
+            worker.conn.close()
+            worker.conn = None
+            return
+
+        if message['type'] == 'health':
+            worker.health = message['health']
+            worker.health_at = time.monotonic()
+
+        elif message['type'] == 'broadcast':
+            for other in self.workers:
+                if other is not worker and other.conn and other.alive:
+                    try:
+                        other.conn.send(message)
+                    except (OSError, EOFError) as e:
+                        log.warning(f"Unable to relay {message['kind']} to worker {other.worker_id}: {e}")
+
+    def status(self) -> dict:
+        """
+        Aggregates the health reported by every worker
+        """
+        now = time.monotonic()
+        workers = []
+        for worker in self.workers:
+            shards = worker.health.get('shards', {})
+            workers.append({
+                'worker': worker.worker_id,
+                'pid': worker.process.pid if worker.process else None,
+                'alive': worker.alive,
+                'restarts': worker.restarts,
+                'shards': f"{worker.shard_ids[0]}-{worker.shard_ids[-1]}",
+                'shards_alive': sum(1 for shard in shards.values() if shard['alive']),
+                'guilds': worker.health.get('guilds', 0),
+                'last_report': round(now - worker.health_at, 1) if worker.health_at else None
+            })
+
+        latencies = [shard['latency'] for worker in self.workers
+                     for shard in worker.health.get('shards', {}).values()
+                     if shard['alive'] and not math.isnan(shard['latency'])]
+        return {
+            'healthy': all(worker['alive'] for worker in workers)
+                       and sum(worker['shards_alive'] for worker in workers) == self.shard_count,
+            'shard_count': self.shard_count,
+            'guilds': sum(worker['guilds'] for worker in workers),
+            'queries': max((worker.health.get('queries', 0) for worker in self.workers), default=0),
+            'latency': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'workers': workers
+        }
+
+    def log_health(self) -> None:
+        status = self.status()
+        alive = sum(1 for worker in status['workers'] if worker['alive'])
+        shards_alive = sum(worker['shards_alive'] for worker in status['workers'])
+        log.info(f"{alive}/{len(self.workers)} workers and {shards_alive}/{self.shard_count} shards up, "
+                 f"{status['guilds']} guilds, average latency {status['latency']}s")
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    def shutdown(self) -> None:
+        """
+        Asks every worker to shut down gracefully, killing any that take too long
+        """
+        log.info("Shutting down the cluster")
+        for worker in self.workers:
+            if worker.alive:
+                worker.process.terminate()  # Workers handle SIGTERM by closing the bot
+
+        deadline = time.monotonic() + float(cluster_config.get("shutdown_timeout", 30.0))
+        for worker in self.workers:
+            if worker.process:
+                worker.process.join(max(deadline - time.monotonic(), 0))
+                if worker.process.is_alive():
+                    log.warning(f"Worker {worker.worker_id} didn't shut down in time, killing it")
+                    worker.process.kill()
+
+
+def shard_ranges(shard_count: int, worker_count: int) -> t.List[t.List[int]]:
+    """
+    Splits the shards into contiguous, evenly sized ranges
+    """
+    per_worker, remainder = divmod(shard_count, worker_count)
+    ranges, start = [], 0
+    for i in range(worker_count):
+        size = per_worker + (1 if i < remainder else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+
+    return ranges
+
+
+def recommended_shards() -> int:
+    """
+    Asks Discord how many shards we should be running
+    """
+    token = config["discord"]["dev"]["token"] if config["bot"]["in_dev"] else config["discord"]["prod"]["token"]
+    request = urllib.request.Request("https://discord.com/api/v10/gateway/bot",
+                                     headers={'Authorization': f"Bot {token}", 'User-Agent': "SauceBot"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return int(json.load(response)['shards'])
+
+
+def serve_health(supervisor: Supervisor, host: str, port: int) -> None:
+    """
+    Serves the aggregated cluster health as JSON, returning 503 while any worker or shard is down
+    """
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status = supervisor.status()
+            body = json.dumps(status).encode('utf-8')
+            self.send_response(200 if status['healthy'] else 503)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), HealthHandler)
+    threading.Thread(target=server.serve_forever, name='cluster-health', daemon=True).start()
+    log.info(f"Serving cluster health on http://{host}:{port}/")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=int(cluster_config.get("workers", multiprocessing.cpu_count())))
+    parser.add_argument('--shards', type=int, default=int(cluster_config.get("shard_count", 0)),
+                        help="Total number of shards, defaults to Discord's recommendation")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=config["bot"]["log_level"], format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    shard_count = args.shards or recommended_shards()
+    worker_count = max(min(args.workers, shard_count), 1)
+    log.info(f"Starting {worker_count} workers for {shard_count} shards")
+
+    supervisor = Supervisor(worker_count, shard_count)
+    if cluster_config.get("health_port"):
+        serve_health(supervisor, cluster_config.get("health_host", "127.0.0.1"), int(cluster_config["health_port"]))
+
+    supervisor.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Runs the bot as an HTTP interactions server, instead of connecting to the gateway
+
+Every command the bot has is an interaction, which Discord can deliver to a web server rather than over the gateway.
+Servers don't hold any state of their own beyond caches, so as many as needed can be run behind a load balancer
+without having to coordinate shards. Point the application's interactions endpoint URL at the load balancer once
+they're up. Presence updates aren't available in this mode, as they can only be sent over the gateway.
+
+Verifying Discord's request signatures needs PyNaCl, which hikari only installs with its server extra.
+
+Usage:
+    python interactions.py [--host HOST] [--port PORT]
+"""
+import argparse
+import asyncio
+import typing as t
+
+import aiohttp.web
+import hikari
+import sentry_sdk
+
+from saucebot.components import images, log, memory, metrics
+from saucebot.components.clients import clients
+from saucebot.components.config import config
+from saucebot.components.cooldowns import MemoryCooldownStore, store as cooldown_store
+from saucebot.components.restbot import CommandRouter
+from saucebot.extensions import misc, sauce, settings
+from saucebot.models.servers import Servers
+
+interactions_config = config.get("interactions", {})
+
+_token = config["discord"]["dev"]["token"] if config["bot"]["in_dev"] else config["discord"]["prod"]["token"]
+bot = hikari.RESTBot(_token, hikari.TokenType.BOT, public_key=interactions_config.get("public_key") or None,
+                     logs=config['bot']['log_level'])
+log.start_queue()  # Hand the logging handlers set up above off to a background thread
+
+metrics_runner = None  # type: t.Optional[aiohttp.web.AppRunner]
+_background = []  # type: t.List[asyncio.Task]
+
+
+# Commands are registered with Discord by the gateway bot, these just need to be kept in step with them
+router = CommandRouter(bot, defer_after=float(interactions_config.get("defer_after", 2.0)))
+router.add(hikari.CommandType.SLASH, ("sauce", "url"), sauce.sauce_url, ephemeral=True)
+router.add(hikari.CommandType.SLASH, ("sauce", "file"), sauce.sauce_file, ephemeral=True)
+router.add(hikari.CommandType.MESSAGE, ("sauce",), sauce.message_sauce, ephemeral=True)
+router.add(hikari.CommandType.SLASH, ("config", "api_key"), settings.api_key, ephemeral=True, guild_only=True,
+           permissions=hikari.Permissions.ADMINISTRATOR)
+router.add(hikari.CommandType.SLASH, ("config", "language"), settings.language, ephemeral=True, guild_only=True,
+           permissions=hikari.Permissions.ADMINISTRATOR)
+router.add(hikari.CommandType.SLASH, ("help",), misc.bot_help, ephemeral=True)
+bot.set_listener(hikari.CommandInteraction, router.on_command)
+
+
+async def on_start(_bot: hikari.RESTBot) -> None:
+    """
+    Start up everything the gateway bot would on boot, other than presence updates
+    """
+    global metrics_runner
+
+    if config["sentry"]["enabled"] and (not config["bot"]["in_dev"] or config["sentry"]["log_in_dev"]):
+        sentry_sdk.init(
+            config["sentry"]["dsn"],
+            debug=config["bot"]["log_level"] == "DEBUG",
+            environment="development" if config["bot"]["in_dev"] else "production"
+        )
+
+    if isinstance(cooldown_store, MemoryCooldownStore):
+        log.warning("Cooldowns are kept in memory, so they won't be shared with any other servers")
+
+    await clients.start()
+    await sauce.warm_caches()
+    await Servers.load_query_total()
+
+    metrics_config = config.get("metrics", {})
+    if metrics_config.get("enabled", False):
+        host, port = metrics_config.get("host", "127.0.0.1"), int(metrics_config.get("port", 9120))
+        metrics_runner = await metrics.start_server(host, port)
+        log.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    for seconds, func in ((30, sauce.write_caches), (30, Servers.flush_queries), (2, cooldown_store.sync),
+                          (300, Servers.load_query_total), (60, update_memory_metrics)):
+        _background.append(asyncio.create_task(_every(seconds, func)))
+
+
+async def on_stop(_bot: hikari.RESTBot) -> None:
+    """
+    Let any running commands finish, then write out everything we're still holding on to
+    """
+    for task in _background:
+        task.cancel()
+
+    await router.close()
+    await sauce.write_caches()
+    await Servers.flush_queries()
+    await cooldown_store.sync()
+    await clients.close()
+    images.shutdown()
+
+    if metrics_runner:
+        await metrics_runner.cleanup()
+
+
+async def update_memory_metrics() -> None:
+    metrics.resident_memory.set(memory.rss_bytes())
+
+
+async def _every(seconds: float, func: t.Callable[[], t.Awaitable]) -> None:
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await func()
+        except Exception:
+            log.exception(f"Background task {func.__name__} failed")
+
+
+bot.add_startup_callback(on_start)
+bot.add_shutdown_callback(on_stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=interactions_config.get("host", "0.0.0.0"))
+    parser.add_argument('--port', type=int, default=int(interactions_config.get("port", 8080)))
+    args = parser.parse_args()
+
+    bot.run(host=args.host, port=args.port, path=interactions_config.get("path", "/"))
+
+
+if __name__ == '__main__':
+    main()
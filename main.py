@@ -1,5 +1,7 @@
-import datetime
+import asyncio
+import typing as t
 
+import aiohttp.web
 import hikari
 import humanize
 import lightbulb
@@ -7,15 +9,18 @@ import sentry_sdk
 from lightbulb.ext import tasks
 
 from bot import bot
-from saucebot.components import log, embeds
+from saucebot.components import cluster, images, log, memory, metrics
+from saucebot.components.clients import clients
 from saucebot.components.config import config
-from saucebot.components.helpers import codewrap
+from saucebot.components.cooldowns import store as cooldown_store
+from saucebot.components.errors import error_embeds
 from saucebot.extensions import extensions
-from saucebot.lang.lang import lang
 from saucebot.models.servers import Servers
 
 __all__ = []
 
+metrics_runner = None  # type: t.Optional[aiohttp.web.AppRunner]
+
 
 # Load extensions
 for ext in extensions:
@@ -39,12 +44,80 @@ async def on_start(event: hikari.StartingEvent):
         )
 
 
+@bot.listen(hikari.StartingEvent)
+async def start_clients(event: hikari.StartingEvent):
+    """
+    Open the pooled HTTP clients used to talk to SauceNao and AniList
+    """
+    await clients.start()
+
+
+@bot.listen(hikari.StoppedEvent)
+async def close_clients(event: hikari.StoppedEvent):
+    await clients.close()
+    images.shutdown()
+
+
+@bot.listen(hikari.StartingEvent)
+async def start_metrics_server(event: hikari.StartingEvent):
+    """
+    Expose our metrics for Prometheus to scrape, if enabled
+    """
+    global metrics_runner
+    metrics_config = config.get("metrics", {})
+    if not metrics_config.get("enabled", False):
+        return
+
+    # Cluster workers each serve their own metrics on consecutive ports
+    host, port = metrics_config.get("host", "127.0.0.1"), int(metrics_config.get("port", 9120)) + cluster.worker_id
+    metrics_runner = await metrics.start_server(host, port)
+    log.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+@bot.listen(hikari.StoppedEvent)
+async def stop_metrics_server(event: hikari.StoppedEvent):
+    if metrics_runner:
+        await metrics_runner.cleanup()
+
+
+@bot.listen(hikari.StartingEvent)
+async def load_query_total(event: hikari.StartingEvent):
+    """
+    Seed the global query counter shown in /help and the bots presence
+    """
+    await Servers.load_query_total()
+
+
 @bot.listen(hikari.events.StartedEvent)
 async def on_ready(event: hikari.StartingEvent):
     """
     Initialize tasks once the bot is ready
     """
     update_presence.start()
+    flush_query_counts.start()
+    sync_cooldowns.start()
+    update_memory_metrics.start()
+
+    if cluster.is_clustered():
+        cluster.listen(asyncio.get_running_loop())
+        report_health.start()
+        sync_query_total.start()
+
+
+@bot.listen(hikari.StoppingEvent)
+async def on_stopping(event: hikari.StoppingEvent):
+    """
+    Write out any query counts and cooldowns we're still holding on to before shutting down
+    """
+    flush_query_counts.cancel()
+    sync_cooldowns.cancel()
+    update_memory_metrics.cancel()
+    if cluster.is_clustered():
+        report_health.cancel()
+        sync_query_total.cancel()
+
+    await Servers.flush_queries()
+    await cooldown_store.sync()
 
 
 @bot.listen(lightbulb.CommandErrorEvent)
@@ -58,70 +131,63 @@ async def on_error(event: lightbulb.CommandErrorEvent) -> None:
 
     # Unwrap the exception to get the original cause
     exception = event.exception.__cause__ or event.exception
-    exceptions = [exception]
-    caught = False
-    _embeds = []
 
     if isinstance(exception, lightbulb.errors.CommandNotFound):
         log.debug(str(exception))
         return
 
-    if isinstance(exception, lightbulb.errors.CheckFailure):
-        if exception.causes:
-            exceptions = exception.causes
-
-    for exc in exceptions:
-        if isinstance(exc, lightbulb.NotOwner):
-            _embeds.append(embeds.error(
-                message=f"Only my owner is allowed to ask me to do that!"
-            ))
-            caught = True
-            continue
-
-        if isinstance(exc, lightbulb.errors.CommandIsOnCooldown):
-            # noinspection PyUnresolvedReferences
-            retry_after = humanize.naturaldelta(datetime.timedelta(seconds=exception.retry_after))
-            _embeds.append(embeds.error(
-                message=f"The sauce commands are on cooldown!\n\nPlease try again in `{retry_after}`"
-            ))
-            caught = True
-            continue
-
-        if isinstance(exc, lightbulb.errors.MissingRequiredPermission):
-            perms = "\n".join(f"**{mp.name}**" for mp in exc.missing_perms)
-            _embeds.append(embeds.error(
-                message=f"You are missing the following permissions needed to run this command:\n\n {perms}"
-            ))
-            caught = True
-            continue
-
-        if isinstance(exc, lightbulb.errors.OnlyInGuild):
-            _embeds.append(embeds.error(
-                message=f"This command can only be executed inside of a guild"
-            ))
-            caught = True
-            continue
-
-        log.warning(f"Uncaught check error: {exc}")
-
-    if not caught:
+    _embeds = error_embeds(exception)
+    if _embeds is None:
         raise exception
 
-    await event.context.respond(embeds=_embeds[:10])
+    await event.context.respond(embeds=_embeds)
+
 
+@tasks.task(s=30)
+async def flush_query_counts():
+    """
+    Write the query counts collected since the last flush to the database
+    """
+    await Servers.flush_queries()
 
-@bot.command()
-@lightbulb.command("help", "Learn how to find the source of images posted in this server!", ephemeral=True)
-@lightbulb.implements(lightbulb.SlashCommand)
-async def bot_help(ctx: lightbulb.SlashContext):
-    embed = embeds.base_embed()
-    embed.title = lang('Misc', 'info_title')
-    embed.description = lang('Misc', 'info_desc')
 
-    query_count = await Servers.count_queries()
-    embed.url = "https://www.patreon.com/saucebot"
-    embed.add_field("Sauce queries processed", codewrap(humanize.intcomma(query_count)))
-    await ctx.respond(embed)
+@tasks.task(s=2)
+async def sync_cooldowns():
+    """
+    Share the cooldowns used since the last sync with any other processes, and pick up theirs
+    """
+    await cooldown_store.sync()
+
+
+@tasks.task(m=1)
+async def update_memory_metrics():
+    """
+    Sample the process' memory use and gateway cache size
+    """
+    metrics.resident_memory.set(memory.rss_bytes())
+    for component, count in memory.cache_counts(bot.cache).items():
+        metrics.cache_entries.set(count, component=component)
+
+
+@tasks.task(m=5)
+async def sync_query_total():
+    """
+    Pick up the queries other cluster workers have written to the database since we last looked
+    """
+    await Servers.load_query_total()
+
+
+@tasks.task(s=15)
+async def report_health():
+    """
+    Let the cluster supervisor know how our shards are doing
+    """
+    cluster.report_health(
+        shards={shard_id: {'alive': shard.is_alive, 'latency': shard.heartbeat_latency}
+                for shard_id, shard in bot.shards.items()},
+        guilds=len(bot.cache.get_guilds_view()),
+        queries=await Servers.count_queries()
+    )
 
 
 @tasks.task(h=1)
@@ -137,5 +203,39 @@ async def update_presence():
         )
     )
 
+    # Report our memory footprint, so we can keep an eye on how it grows with the number of guilds
+    counts = memory.cache_counts(bot.cache)
+    rss = memory.rss_bytes()
+    log.info(f"Memory: {humanize.naturalsize(rss, binary=True)} RSS, "
+             f"{humanize.naturalsize(rss / max(counts['guilds'], 1), binary=True)} per guild; cached "
+             + ", ".join(f"{count} {component}" for component, count in counts.items() if count))
+
+    # Report how many SauceNao queries the cache is saving us
+    for key_type in ('attachment', 'content', 'url'):
+        hits = metrics.cache_lookups.get(key_type=key_type, result='hit')
+        misses = metrics.cache_lookups.get(key_type=key_type, result='miss')
+        log.info(f"Sauce cache ({key_type} keys): {hits:.0f} hits, {misses:.0f} misses")
+
+    speculative = {result: metrics.speculative_lookups.get(result=result)
+                   for result in ('hit', 'joined', 'wasted', 'cancelled')}
+    if any(speculative.values()):
+        paid_off = (speculative['hit'] + speculative['joined']) / sum(speculative.values())
+        log.info(f"Speculative lookups: {paid_off:.1%} paid off ("
+                 + ", ".join(f"{count:.0f} {result}" for result, count in speculative.items()) + ")")
+
+    for upstream in clients.UPSTREAMS:
+        reused = metrics.http_connections.get(upstream=upstream, reused='true')
+        created = metrics.http_connections.get(upstream=upstream, reused='false')
+        if reused or created:
+            log.info(f"{upstream} connections: {reused / (reused + created):.1%} reused ({created:.0f} opened)")
+
+
+def run(shard_ids: t.Optional[t.Sequence[int]] = None, shard_count: t.Optional[int] = None):
+    """
+    Runs the bot, optionally only for a subset of its shards when started as a cluster worker
+    """
+    bot.run(shard_ids=shard_ids, shard_count=shard_count)
+
 
-bot.run()
+if __name__ == '__main__':
+    run()
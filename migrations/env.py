@@ -26,7 +26,9 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from saucebot.models.servers import Servers
-target_metadata = [Servers.metadata]
+from saucebot.models.cache import CacheEntries
+from saucebot.models.cooldowns import Cooldowns
+target_metadata = [Servers.metadata, CacheEntries.metadata, Cooldowns.metadata]
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -0,0 +1,30 @@
+"""create_cache_entries_table
+
+Revision ID: 7c01cab1d789
+Revises: 34cbab1d1b4a
+Create Date: 2026-10-18 12:02:41.519204
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '7c01cab1d789'
+down_revision = '34cbab1d1b4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('cache_entries',
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('value', sa.Text(), nullable=True),
+        sa.Column('expires_at', sa.BigInteger(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_cache_entries_expires_at'), 'cache_entries', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_cache_entries_expires_at'), table_name='cache_entries')
+    op.drop_table('cache_entries')
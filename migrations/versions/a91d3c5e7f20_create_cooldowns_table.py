@@ -0,0 +1,30 @@
+"""create_cooldowns_table
+
+Revision ID: a91d3c5e7f20
+Revises: e4b2f19a6c03
+Create Date: 2026-10-18 17:12:36.802157
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a91d3c5e7f20'
+down_revision = 'e4b2f19a6c03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('cooldowns',
+        sa.Column('key', sa.String(length=128), nullable=False),
+        sa.Column('uses', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.BigInteger(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_cooldowns_expires_at'), 'cooldowns', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_cooldowns_expires_at'), table_name='cooldowns')
+    op.drop_table('cooldowns')
@@ -0,0 +1,23 @@
+"""add_language_column
+
+Revision ID: e4b2f19a6c03
+Revises: 7c01cab1d789
+Create Date: 2026-10-18 15:41:09.274415
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e4b2f19a6c03'
+down_revision = '7c01cab1d789'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('servers', sa.Column('language', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('servers', 'language')
@@ -0,0 +1,66 @@
+import ipaddress
+import socket
+import typing as t
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp.abc import AbstractResolver
+
+__all__ = ['is_public_address', 'check_url', 'PublicResolver']
+
+
+def is_public_address(host: str) -> bool:
+    """
+    Checks whether an IP address is reachable on the public internet, rather than loopback, private or link-local
+    """
+    address = ipaddress.ip_address(host.split('%', 1)[0])  # Strip any IPv6 zone ID
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+        address = address.ipv4_mapped
+
+    return address.is_global and not address.is_multicast
+
+
+def check_url(url: str, allow_private: bool = False) -> None:
+    """
+    Refuses URLs we shouldn't be fetching on a user's behalf, raising ValueError for anything other than public
+    http(s) links
+
+    Hostnames are checked as they're resolved by PublicResolver, as aiohttp only skips the resolver for IP addresses
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f"Refusing to fetch a non-http(s) URL: {url}")
+
+    if allow_private:
+        return
+
+    try:
+        public = is_public_address(parts.hostname)
+    except ValueError:
+        return  # A hostname rather than an address
+
+    if not public:
+        raise ValueError(f"Refusing to fetch from a non-public address: {parts.hostname}")
+
+
+class PublicResolver(AbstractResolver):
+    """
+    Resolves hostnames like aiohttp's default resolver, but drops any address that isn't public
+
+    Checking addresses as they're connected to, rather than ahead of time, means a hostname can't be pointed somewhere
+    else between the check and the request
+    """
+
+    def __init__(self):
+        self._resolver = aiohttp.DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> t.List[t.Dict[str, t.Any]]:
+        hosts = [entry for entry in await self._resolver.resolve(host, port, family)
+                 if is_public_address(entry['host'])]
+        if not hosts:
+            raise OSError(f"{host} does not resolve to a public address")
+
+        return hosts
+
+    async def close(self) -> None:
+        await self._resolver.close()
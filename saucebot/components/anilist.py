@@ -0,0 +1,66 @@
+import json
+import re
+import typing as t
+from datetime import date
+
+from saucebot.components.helpers import escape_markdown, truncate
+
+__all__ = ['AniListRecord', 'process_media', 'serialize_record', 'deserialize_record']
+
+
+class AniListRecord(t.NamedTuple):
+    """
+    The parts of an AniList media entry used in anime embeds, already cleaned up and ready for display
+    """
+    description: str
+    cover_url: t.Optional[str]
+    genres: t.List[str]
+    season: t.Optional[str]  # spring, summer, fall or winter; localized when the embed is built
+    year: t.Optional[int]
+    rank: t.Optional[int]
+    score: t.Optional[int]
+
+
+def process_media(media: dict) -> AniListRecord:
+    """
+    Converts a raw AniList media entry into a record
+    """
+    description = str(media['description']).replace("<br>", "\n")  # Replace breaks with newlines
+    description = description.replace("<br/>", "\n")
+    description = re.sub('<[^<]+?>', '', description)  # Strip HTML tags
+    description = re.sub(r'\n{3,}', "\n\n", description)  # Reduce excessive newlines
+    description = truncate(escape_markdown(description), 4096)
+
+    season, year = None, None
+    start_date = media['startDate'] or {}
+    if start_date.get('year') and start_date.get('month') and start_date.get('day'):
+        year = start_date['year']
+
+        # Get the approximate season
+        yday = date(start_date['year'], start_date['month'], start_date['day']).timetuple().tm_yday
+        if yday in range(80, 172):
+            season = 'spring'
+        elif yday in range(172, 264):
+            season = 'summer'
+        elif yday in range(264, 355):
+            season = 'fall'
+        else:
+            season = 'winter'
+
+    return AniListRecord(
+        description=description,
+        cover_url=(media['coverImage'] or {}).get('extraLarge'),
+        genres=media['genres'] or [],
+        season=season,
+        year=year,
+        rank=media['rankings'][0]['rank'] if media['rankings'] else None,
+        score=media['averageScore']
+    )
+
+
+def serialize_record(record: AniListRecord) -> str:
+    return json.dumps(record._asdict())
+
+
+def deserialize_record(value: str) -> AniListRecord:
+    return AniListRecord(**json.loads(value))
@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import json
+import time
+import typing as t
+from urllib.parse import urlsplit, parse_qsl, urlencode, unquote
+
+import aiohttp
+import cachetools
+import pysaucenao
+import pysaucenao.containers
+from sqlalchemy.exc import SQLAlchemyError
+
+from saucebot.components import images, log, metrics
+from saucebot.models.cache import CacheEntries
+
+__all__ = ['MISSING', 'TieredCache', 'cache_key', 'content_key', 'key_type', 'canonicalize_attachment_url',
+           'serialize_results', 'deserialize_results']
+
+
+DISCORD_CDN_HOSTS = ('cdn.discordapp.com', 'media.discordapp.net')
+SIGNATURE_PARAMS = frozenset({'ex', 'is', 'hm'})
+
+# Returned by TieredCache.get() on a cache miss, since None is a perfectly valid thing to cache
+MISSING = object()
+
+# Remembers the content key each attachment or URL resolved to, so we only ever download each image once
+_content_keys = cachetools.TTLCache(maxsize=65536, ttl=3600)
+
+
+class TieredCache:
+    """
+    An in-memory cache backed by a persistent tier in the database
+
+    Reads fall through to the database when an entry isn't held locally. Writes are applied locally right away
+    and queued up to be written to the database in batches by flush()
+    """
+
+    def __init__(self, namespace: str, *, maxsize: int, ttl: int,
+                 serializer: t.Callable[[t.Any], str], deserializer: t.Callable[[str], t.Any],
+                 persistent: bool = True):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.persistent = persistent
+
+        self._serializer = serializer
+        self._deserializer = deserializer
+        self._local = cachetools.TLRUCache(maxsize=maxsize, ttu=lambda _key, entry, _now: entry[1], timer=time.time)
+        self._pending = {}  # type: t.Dict[str, t.Tuple[t.Any, int]]
+        self._last_purge = time.time()
+
+    async def get(self, key: str) -> t.Any:
+        """
+        Gets a cached value, or MISSING if the key is not cached in either tier
+        """
+        try:
+            return self._local[key][0]
+        except KeyError:
+            pass
+
+        if not self.persistent:
+            return MISSING
+
+        try:
+            entry = await CacheEntries.get(f"{self.namespace}:{key}")
+        except SQLAlchemyError:
+            log.exception(f"Failed to read {key} from the persistent {self.namespace} cache")
+            return MISSING
+
+        if not entry:
+            return MISSING
+
+        value, expires_at = entry
+        try:
+            value = self._deserializer(value)
+        except Exception as e:
+            log.warning(f"Discarding unreadable {self.namespace} cache entry {key}: {e}")
+            return MISSING
+
+        self._local[key] = (value, expires_at)
+        return value
+
+    def set(self, key: str, value: t.Any, ttl: t.Optional[int] = None) -> None:
+        """
+        Caches a value locally and queues it to be persisted on the next flush
+        """
+        expires_at = int(time.time()) + (ttl or self.ttl)
+        self._local[key] = (value, expires_at)
+        if self.persistent:
+            self._pending[key] = (value, expires_at)
+
+    async def flush(self) -> None:
+        """
+        Writes any pending entries to the database, and periodically clears out expired ones
+        """
+        if not self.persistent:
+            return
+
+        if self._pending:
+            pending, self._pending = self._pending, {}
+            entries = []
+            for key, (value, expires_at) in pending.items():
+                # A value we can't serialize is only ever kept locally, rather than holding up the rest of the batch
+                try:
+                    entries.append(
+                        {'key': f"{self.namespace}:{key}", 'value': self._serializer(value), 'expires_at': expires_at}
+                    )
+                except Exception:
+                    log.exception(f"Unable to serialize {self.namespace} cache entry {key}, it won't be persisted")
+
+            try:
+                for i in range(0, len(entries), 500):
+                    await CacheEntries.put_many(entries[i:i + 500])
+            except SQLAlchemyError:
+                log.exception(f"Failed to persist {len(entries)} {self.namespace} cache entries, will retry")
+                for key, entry in pending.items():
+                    self._pending.setdefault(key, entry)
+                return
+
+            log.debug("Persisted %d %s cache entries", None, len(entries), self.namespace)
+
+        if time.time() - self._last_purge > 3600:
+            self._last_purge = time.time()
+            try:
+                purged = await CacheEntries.purge_expired()
+                log.debug("Purged %d expired cache entries", None, purged)
+            except SQLAlchemyError:
+                log.exception("Failed to purge expired cache entries")
+
+    async def warm(self, limit: int) -> None:
+        """
+        Pre-loads the local tier with the longest lived entries from the database
+        """
+        if not self.persistent or not limit:
+            return
+
+        rows = await CacheEntries.recent(f"{self.namespace}:", limit)
+
+        # Load the longest lived entries last so they're the least likely to be evicted
+        loaded = 0
+        for key, value, expires_at in reversed(rows):
+            try:
+                self._local[key.split(':', 1)[1]] = (self._deserializer(value), expires_at)
+                loaded += 1
+            except Exception:
+                continue
+
+        log.info(f"Warmed the {self.namespace} cache with {loaded} entries")
+
+
+async def cache_key(url: str) -> str:
+    """
+    Resolves a stable cache key for the image at the supplied URL
+
+    Images are downloaded once and keyed on a digest of their content, so the same image reposted as a new attachment
+    or shared from anywhere else shares a key. Which key a URL resolved to is remembered, with Discord attachments
+    remembered by their attachment ID and filename so that re-signed or proxied links to them aren't downloaded again.
+    Falls back to keying on the attachment or URL itself if the image can't be downloaded.
+    """
+    canonical_url = canonicalize_attachment_url(url)
+    if canonical_url:
+        fallback_key = f"attachment:{_digest(canonical_url.encode('utf-8'))}"
+    else:
+        fallback_key = f"url:{_digest(url.encode('utf-8'))}"
+
+    if fallback_key in _content_keys:
+        return _content_keys[fallback_key]
+
+    try:
+        content = await images.fetch(url)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        metrics.upstream_errors.inc(upstream='images', exception=type(e).__name__)
+        log.debug("Unable to fetch %s for content keying, falling back to %s: %s", None, url, key_type(fallback_key), e)
+        return fallback_key
+
+    key = content_key(content)
+    _content_keys[fallback_key] = key
+    return key
+
+
+def content_key(content: bytes) -> str:
+    """
+    Returns the cache key for an image we have the content of
+    """
+    return f"content:{_digest(content)}"
+
+
+def key_type(key: str) -> str:
+    """
+    Returns the type of the supplied cache key (attachment, content or url)
+    """
+    return key.split(':', 1)[0]
+
+
+def canonicalize_attachment_url(url: str) -> t.Optional[str]:
+    """
+    Reduces a Discord attachment URL to its attachment ID, filename and any non-signature query parameters
+
+    Returns None if the URL does not point to a Discord attachment
+    """
+    parts = urlsplit(url)
+    if parts.hostname not in DISCORD_CDN_HOSTS:
+        return None
+
+    # /attachments/{channel_id}/{attachment_id}/{filename}
+    path = unquote(parts.path).strip('/').split('/')
+    if len(path) != 4 or path[0] not in ('attachments', 'ephemeral-attachments'):
+        return None
+
+    attachment_id, filename = path[2], path[3]
+    params = sorted((k, v) for k, v in parse_qsl(parts.query) if k not in SIGNATURE_PARAMS)
+
+    canonical_url = f"{attachment_id}/{filename}"
+    if params:
+        canonical_url += f"?{urlencode(params)}"
+
+    return canonical_url
+
+
+def serialize_results(results: t.Sequence[pysaucenao.GenericSource]) -> str:
+    """
+    Serializes every result from a SauceNao search into a record that can be stored in the persistent cache
+    """
+    return json.dumps([_sauce_record(sauce) for sauce in results])
+
+
+def deserialize_results(value: str) -> t.List[pysaucenao.GenericSource]:
+    """
+    Rebuilds the results of a SauceNao search from a persistent cache record
+    """
+    return [_sauce_from_record(record) for record in json.loads(value)]
+
+
+def _sauce_record(sauce: pysaucenao.GenericSource) -> dict:
+    record = {'type': type(sauce).__name__, 'header': sauce.header, 'data': sauce.data}
+
+    # The ID properties raise until load_ids() has run, so the IDs it loaded (if any) are stored as they came
+    if isinstance(sauce, pysaucenao.AnimeSource) and sauce._ids is not None:
+        record['ids'] = sauce._ids
+
+    return record
+
+
+def _sauce_from_record(record: dict) -> pysaucenao.GenericSource:
+    source_class = getattr(pysaucenao.containers, record['type'], None)
+    if not (isinstance(source_class, type) and issubclass(source_class, pysaucenao.GenericSource)):
+        raise ValueError(f"Unknown result type {record['type']}")
+
+    sauce = source_class(record['header'], record['data'])
+    if isinstance(sauce, pysaucenao.AnimeSource) and record.get('ids') is not None:
+        sauce._ids = record['ids']
+
+    return sauce
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
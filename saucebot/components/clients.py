@@ -0,0 +1,220 @@
+import asyncio
+import typing as t
+
+import aiohttp
+import cachetools
+import pysaucenao
+from pysaucenao.containers import SauceNaoResults
+
+from saucebot.components import log, metrics
+from saucebot.components.addresses import PublicResolver
+from saucebot.components.config import config
+
+__all__ = ['SauceNaoClient', 'AniListClient', 'ClientRegistry', 'clients']
+
+
+SAUCENAO_URL = config["saucenao"].get("api_url", "https://saucenao.com/search.php")
+ANILIST_URL = config.get("anilist", {}).get("api_url", "https://graphql.anilist.co")
+
+ANILIST_QUERY = """
+query ($id: Int) {
+  Media(id: $id, type: ANIME) {
+    description
+    coverImage { extraLarge }
+    genres
+    startDate { year month day }
+    rankings { rank }
+    averageScore
+  }
+}
+"""
+
+
+class SauceNaoClient:
+    """
+    A SauceNao search client that sends its requests through a shared, pooled session
+
+    Responses are parsed and errors raised the same way pysaucenao does in strict mode, so callers can handle the usual
+    pysaucenao exceptions. The one exception is status 1, which only means some indexes are offline, so the results
+    from the rest are still returned rather than thrown away.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, api_key: str, *, min_similarity: float = 50.0,
+                 priority: t.Optional[t.List[int]] = None, results_limit: int = 6):
+        self.api_key = api_key
+        self.min_similarity = min_similarity
+        self.priority = priority
+
+        self._session = session
+        self._params = {'api_key': api_key, 'db': '999', 'output_type': 2, 'numres': results_limit}
+
+    async def from_url(self, url: str) -> SauceNaoResults:
+        return await self._search({**self._params, 'url': url})
+
+    async def from_file(self, content: bytes, filename: str = "image.jpg") -> SauceNaoResults:
+        data = aiohttp.FormData()
+        data.add_field('file', content, filename=filename)
+        return await self._search(self._params, data)
+
+    async def _search(self, params: dict, data: t.Optional[aiohttp.FormData] = None) -> SauceNaoResults:
+        try:
+            return await self._request(params, data)
+        except (pysaucenao.SauceNaoException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.upstream_errors.inc(upstream='saucenao', exception=type(e).__name__)
+            raise
+
+    async def _request(self, params: dict, data: t.Optional[aiohttp.FormData]) -> SauceNaoResults:
+        async with self._session.post(SAUCENAO_URL, params=params, data=data) as response:
+            status = response.status
+            try:
+                body = await response.json(content_type=None)
+            except ValueError:
+                raise pysaucenao.SauceNaoException(f"SauceNao returned an invalid response (HTTP {status})")
+
+        # Mirrors pysaucenao's own checks in strict mode, so we raise the same exceptions it would
+        header = body.get('header', {}) if isinstance(body, dict) else {}
+        message = header.get('message', '')
+        if status == 429:
+            if int(header.get('status', 0)) == -2:
+                raise pysaucenao.TooManyFailedRequestsException(message)
+            if "searches every 30 seconds" in message:
+                raise pysaucenao.ShortLimitReachedException(message)
+            raise pysaucenao.DailyLimitReachedException(message)
+
+        if status == 403:
+            raise pysaucenao.InvalidOrWrongApiKeyException(message)
+        if status == 413:
+            raise pysaucenao.FileSizeLimitException(message)
+        if status != 200:
+            raise pysaucenao.UnknownStatusCodeException(f"HTTP {status}")
+
+        # SauceNao runs searches with a key it doesn't recognize as guest searches, rather than rejecting them
+        if self.api_key and not header.get('account_type'):
+            raise pysaucenao.InvalidOrWrongApiKeyException("The provided API key does not exist")
+
+        header_status = int(header.get('status', 0))
+        if header_status == 1:
+            # Some indexes are offline or there's a problem with the account, but the rest can still return results
+            log.warning(f"SauceNao returned status 1: {message}")
+        elif header_status == -1:
+            # The account doesn't have API access, which most likely means it's been banned
+            raise pysaucenao.BannedException(message)
+        elif header_status in (-3, -4, -6):
+            # An invalid file was uploaded, or SauceNao couldn't download the linked image
+            raise pysaucenao.InvalidImageException(message)
+        elif header_status == -5:
+            raise pysaucenao.FileSizeLimitException(message)
+        elif header_status < 0:
+            raise pysaucenao.UnknownStatusCodeException(header_status)
+
+        return SauceNaoResults(body, self.min_similarity, self.priority)
+
+
+class AniListClient:
+    """
+    Fetches media from the AniList GraphQL API through a shared, pooled session
+    """
+
+    def __init__(self, session: aiohttp.ClientSession):
+        self._session = session
+
+    async def get(self, anilist_id: int) -> dict:
+        """
+        Gets the media entry for an AniList anime ID
+        """
+        payload = {'query': ANILIST_QUERY, 'variables': {'id': anilist_id}}
+        try:
+            async with self._session.post(ANILIST_URL, json=payload) as response:
+                response.raise_for_status()
+                body = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.upstream_errors.inc(upstream='anilist', exception=type(e).__name__)
+            raise
+
+        return body['data']['Media']
+
+
+class ClientRegistry:
+    """
+    Owns the HTTP connection pools for each upstream service we talk to
+
+    Every upstream gets its own keep-alive pool, sized and timed out according to the [http] config section, and
+    all clients for that upstream share it. This needs to be started before use and closed on shutdown.
+    """
+
+    UPSTREAMS = ('saucenao', 'anilist', 'images')
+
+    def __init__(self):
+        self._sessions = {}  # type: t.Dict[str, aiohttp.ClientSession]
+        self._saucenao = cachetools.LRUCache(maxsize=1024)  # type: t.MutableMapping[str, SauceNaoClient]
+        self._anilist = None  # type: t.Optional[AniListClient]
+
+    async def start(self) -> None:
+        for upstream in self.UPSTREAMS:
+            http_config = {**config.get("http", {}), **config.get("http", {}).get(upstream, {})}
+
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._connection_tracer(upstream, reused=False))
+            trace_config.on_connection_reuseconn.append(self._connection_tracer(upstream, reused=True))
+
+            # Images are fetched from links users give us, which mustn't be able to reach anything internal
+            resolver = None
+            if upstream == 'images' and not http_config.get("allow_private_addresses", False):
+                resolver = PublicResolver()
+
+            self._sessions[upstream] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=int(http_config.get("pool_size", 50)),
+                    keepalive_timeout=float(http_config.get("keepalive_timeout", 60.0)),
+                    resolver=resolver
+                ),
+                timeout=aiohttp.ClientTimeout(total=float(http_config.get("timeout", 15.0))),
+                trace_configs=[trace_config]
+            )
+
+        self._anilist = AniListClient(self._sessions['anilist'])
+        log.debug(f"Started HTTP client pools for {', '.join(self.UPSTREAMS)}")
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            await session.close()
+
+        self._sessions.clear()
+        self._saucenao.clear()
+        self._anilist = None
+
+    def session(self, upstream: str) -> aiohttp.ClientSession:
+        if upstream not in self._sessions:
+            raise RuntimeError("The client registry has not been started")
+
+        return self._sessions[upstream]
+
+    def saucenao(self, api_key: str) -> SauceNaoClient:
+        """
+        Gets the SauceNao client for an API key, creating it the first time the key is used
+        """
+        if api_key not in self._saucenao:
+            self._saucenao[api_key] = SauceNaoClient(
+                self.session('saucenao'),
+                api_key,
+                min_similarity=float(config["saucenao"]["min_similarity"]),
+                priority=[int(index) for index in config["saucenao"].get("priority", [21, 22, 5, 37, 25])]
+            )
+
+        return self._saucenao[api_key]
+
+    def anilist(self) -> AniListClient:
+        if not self._anilist:
+            raise RuntimeError("The client registry has not been started")
+
+        return self._anilist
+
+    @staticmethod
+    def _connection_tracer(upstream: str, reused: bool):
+        async def _trace(_session, _context, _params):
+            metrics.http_connections.inc(upstream=upstream, reused=str(reused).lower())
+
+        return _trace
+
+
+clients = ClientRegistry()
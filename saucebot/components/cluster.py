@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import typing as t
+from multiprocessing.connection import Connection
+
+from saucebot.components import log
+
+__all__ = ['attach', 'is_clustered', 'worker_id', 'worker_count', 'broadcast', 'report_health', 'on', 'listen']
+
+
+# Set when this process is a worker started by the cluster supervisor (see cluster.py)
+worker_id = 0
+worker_count = 1
+_conn = None  # type: t.Optional[Connection]
+_send_lock = threading.Lock()
+_handlers = {}  # type: t.Dict[str, t.Callable[[dict], t.Any]]
+
+
+def attach(conn: Connection, _worker_id: int, _worker_count: int) -> None:
+    """
+    Links this process to the cluster supervisor over the supplied pipe
+    """
+    global _conn, worker_id, worker_count
+    _conn = conn
+    worker_id = _worker_id
+    worker_count = _worker_count
+
+
+def is_clustered() -> bool:
+    return _conn is not None
+
+
+def on(kind: str):
+    """
+    Registers a handler for messages of the given kind broadcast by other workers
+
+    Handlers are called on the event loop with the message payload, and are never called for our own broadcasts
+    """
+    def decorator(func: t.Callable[[dict], t.Any]):
+        _handlers[kind] = func
+        return func
+
+    return decorator
+
+
+def broadcast(kind: str, **payload) -> None:
+    """
+    Sends a message to every other worker in the cluster, does nothing when we aren't clustered
+    """
+    _send({'type': 'broadcast', 'kind': kind, 'payload': payload})
+
+
+def report_health(**health) -> None:
+    """
+    Reports this workers health to the supervisor
+    """
+    _send({'type': 'health', 'health': health})
+
+
+def listen(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Starts dispatching messages from the supervisor to their handlers on the supplied event loop
+    """
+    if _conn:
+        threading.Thread(target=_receive, args=(loop,), name='cluster-listener', daemon=True).start()
+
+
+def _send(message: dict) -> None:
+    if not _conn:
+        return
+
+    try:
+        with _send_lock:
+            _conn.send(message)
+    except (OSError, EOFError) as e:
+        log.warning(f"Unable to reach the cluster supervisor: {e}")
+
+
+def _receive(loop: asyncio.AbstractEventLoop) -> None:
+    while True:
+        try:
+            message = _conn.recv()
+        except (OSError, EOFError):
+            log.warning("Lost connection to the cluster supervisor")
+            return
+
+        handler = _handlers.get(message.get('kind'))
+        if handler:
+            loop.call_soon_threadsafe(handler, message['payload'])
@@ -0,0 +1,168 @@
+import math
+import time
+import typing as t
+
+import lightbulb
+from sqlalchemy.exc import SQLAlchemyError
+
+from saucebot.components import log
+from saucebot.components.config import config
+from saucebot.models.cooldowns import Cooldowns
+
+__all__ = ['CooldownStore', 'MemoryCooldownStore', 'DatabaseCooldownStore', 'SharedCooldownManager', 'store']
+
+
+class _Window:
+    __slots__ = ('expires_at', 'stored', 'pending', 'checked')
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+        self.stored = 0  # Uses recorded in the store as of the last sync
+        self.pending = 0  # Uses made here that haven't been written to the store yet
+        self.checked = True  # Whether the window has been checked since the last sync
+
+    @property
+    def uses(self) -> int:
+        return self.stored + self.pending
+
+
+class CooldownStore:
+    """
+    Counts command uses in fixed cooldown windows
+
+    Windows are aligned to multiples of their length since the epoch, so every process agrees on when a window
+    starts and ends without having to coordinate. Checks are always answered from memory; stores that share their
+    counts elsewhere do so in the background with sync().
+    """
+
+    def __init__(self):
+        self._windows = {}  # type: t.Dict[str, _Window]
+
+    def acquire(self, key: str, length: float, uses: int) -> float:
+        """
+        Records a use of the cooldown, returning 0 if it was allowed or the seconds until it can be used again if not
+        """
+        now = time.time()
+        window_start = math.floor(now / length) * length
+        window_key = f"{key}:{int(window_start)}"
+
+        window = self._windows.get(window_key)
+        if not window:
+            window = self._windows[window_key] = _Window(window_start + length)
+
+        window.checked = True
+        if window.uses >= uses:
+            return window.expires_at - now
+
+        window.pending += 1
+        return 0.0
+
+    async def sync(self) -> None:
+        """
+        Shares our usage counts and picks up everyone else's, if the store supports it
+        """
+        self._expire()
+
+    def _expire(self) -> None:
+        now = time.time()
+        for window_key in [k for k, window in self._windows.items() if window.expires_at <= now]:
+            del self._windows[window_key]
+
+
+class MemoryCooldownStore(CooldownStore):
+    """
+    Keeps cooldowns in this process only, for running a single instance or testing
+    """
+
+
+class DatabaseCooldownStore(CooldownStore):
+    """
+    Shares cooldowns through the database, so they survive restarts and apply across every process
+
+    Uses are written in batches with atomic increments, and the combined counts for every window checked since the
+    last sync are read back in the same pass, so commands never wait on the database. In exchange, a process may
+    let through one sync interval's worth of uses past the limit before it sees what the others have used.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._last_purge = 0.0
+
+    async def sync(self) -> None:
+        self._expire()
+        if not self._windows:
+            return
+
+        # Snapshot what we're about to write, as more uses can come in while we wait on the database
+        writes = {window_key: window.pending for window_key, window in self._windows.items() if window.pending}
+        reads = [window_key for window_key, window in self._windows.items() if window.checked]
+        for window_key in reads:
+            self._windows[window_key].checked = False
+
+        try:
+            await Cooldowns.add_many([
+                {'key': window_key, 'uses': uses, 'expires_at': math.ceil(self._windows[window_key].expires_at)}
+                for window_key, uses in writes.items()
+            ])
+        except SQLAlchemyError:
+            log.exception(f"Failed to write {len(writes)} cooldowns, will retry")
+            self._recheck(reads)
+            return
+
+        for window_key, uses in writes.items():
+            if window_key in self._windows:
+                self._windows[window_key].pending -= uses
+                self._windows[window_key].stored += uses
+
+        try:
+            stored = await Cooldowns.get_many(reads)
+        except SQLAlchemyError:
+            log.exception(f"Failed to read {len(reads)} cooldowns, will retry")
+            self._recheck(reads)
+            return
+
+        for window_key in reads:
+            window = self._windows.get(window_key)
+            if window:
+                window.stored = max(window.stored, stored.get(window_key, 0))
+
+        if time.time() - self._last_purge > 3600:
+            self._last_purge = time.time()
+            try:
+                await Cooldowns.purge_expired()
+            except SQLAlchemyError:
+                log.exception("Failed to purge expired cooldowns")
+
+    def _recheck(self, window_keys: t.List[str]) -> None:
+        for window_key in window_keys:
+            if window_key in self._windows:
+                self._windows[window_key].checked = True
+
+
+class SharedCooldownManager(lightbulb.CooldownManager):
+    """
+    A lightbulb cooldown manager that keeps its buckets in a cooldown store rather than in memory
+    """
+
+    def __init__(self, name: str, length: float, uses: int, key: t.Callable[[lightbulb.Context], t.Hashable],
+                 cooldown_store: t.Optional[CooldownStore] = None):
+        super().__init__(lambda _: lightbulb.UserBucket(length, uses))
+        self.name = name
+        self.length = length
+        self.uses = uses
+        self.key = key
+        self.store = cooldown_store or store
+
+    async def add_cooldown(self, context: lightbulb.Context) -> None:
+        retry_after = self.store.acquire(self._key(context), self.length, self.uses)
+        if retry_after:
+            raise lightbulb.CommandIsOnCooldown("This command is on cooldown", retry_after=retry_after)
+
+    def _key(self, context: lightbulb.Context) -> str:
+        return f"{self.name}:{self.key(context)}"
+
+
+if config.get("cooldowns", {}).get("backend", "database") == "memory":
+    store = MemoryCooldownStore()  # type: CooldownStore
+else:
+    store = DatabaseCooldownStore()
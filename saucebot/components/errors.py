@@ -0,0 +1,61 @@
+import datetime
+import typing as t
+
+import hikari
+import humanize
+import lightbulb
+
+from saucebot.components import embeds, log
+
+__all__ = ['error_embeds']
+
+
+def error_embeds(exception: Exception) -> t.Optional[t.List[hikari.Embed]]:
+    """
+    Builds the error messages to show the user for a failed command, or returns None if the error isn't one we expect
+    """
+    exceptions = [exception]
+    caught = False
+    _embeds = []
+
+    if isinstance(exception, lightbulb.errors.CheckFailure):
+        if exception.causes:
+            exceptions = exception.causes
+
+    for exc in exceptions:
+        if isinstance(exc, lightbulb.NotOwner):
+            _embeds.append(embeds.error(
+                message=f"Only my owner is allowed to ask me to do that!"
+            ))
+            caught = True
+            continue
+
+        if isinstance(exc, lightbulb.errors.CommandIsOnCooldown):
+            retry_after = humanize.naturaldelta(datetime.timedelta(seconds=exc.retry_after))
+            _embeds.append(embeds.error(
+                message=f"The sauce commands are on cooldown!\n\nPlease try again in `{retry_after}`"
+            ))
+            caught = True
+            continue
+
+        if isinstance(exc, lightbulb.errors.MissingRequiredPermission):
+            perms = "\n".join(f"**{mp.name}**" for mp in exc.missing_perms)
+            _embeds.append(embeds.error(
+                message=f"You are missing the following permissions needed to run this command:\n\n {perms}"
+            ))
+            caught = True
+            continue
+
+        if isinstance(exc, lightbulb.errors.OnlyInGuild):
+            _embeds.append(embeds.error(
+                message=f"This command can only be executed inside of a guild"
+            ))
+            caught = True
+            continue
+
+        log.warning(f"Uncaught check error: {exc}")
+
+    if not caught:
+        return None
+
+    return _embeds[:10]
@@ -0,0 +1,186 @@
+import os
+import threading
+import typing as t
+
+import numpy as np
+
+__all__ = ['HashIndex', 'hamming_distances']
+
+
+# The first slot of the hash file holds the number of entries in the index
+HEADER = 1
+KEY_SIZE = 64
+
+# Hashes are split into four 16 bit blocks, each with a table of the entries holding every possible value for it
+BLOCK_SHIFTS = (0, 16, 32, 48)
+BLOCK_VALUES = 1 << 16
+
+# Number of set bits in every possible byte, for counting them across a whole array of hashes at once
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(hashes: np.ndarray, target: int) -> np.ndarray:
+    """
+    Counts the bits that differ between each of an array of 64 bit hashes and the target hash
+    """
+    xor = np.bitwise_xor(np.ascontiguousarray(hashes, dtype=np.uint64), np.uint64(target))
+    return _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+class HashIndex:
+    """
+    A persistent index of 64 bit perceptual hashes, for finding the stored hashes within max_distance bits of a new one
+
+    Hashes and the keys stored with them are appended to a pair of memory-mapped files, so the index survives restarts
+    and the operating system only has to keep the parts of it being read in memory. Searches use multi-index hashing:
+    a hash within max_distance bits of another must be within max_distance // 4 bits of it in at least one of its four
+    blocks, so only the entries in those few neighbouring buckets need their full distance checked. Entries added
+    since the block tables were last built are checked directly until the next rebuild.
+
+    Only one process should write to an index at a time.
+    """
+
+    # Hashes with nearly every bit the same come from flat images, which all look alike to a difference hash
+    MIN_BITS = 6
+
+    def __init__(self, path: str, *, max_distance: int = 6, initial_capacity: int = 65536, rebuild_after: int = 16384):
+        if not 0 <= max_distance <= 15:
+            raise ValueError("max_distance must be between 0 and 15")
+
+        self.path = path
+        self.keys_path = f"{path}.keys"
+        self.max_distance = max_distance
+        self.rebuild_after = rebuild_after
+
+        self._initial_capacity = initial_capacity
+        self._hashes = None  # type: t.Optional[np.memmap]
+        self._keys = None  # type: t.Optional[np.memmap]
+        self._lock = threading.Lock()
+
+        # The number of entries the tables cover, and the (bucket offsets, entry IDs) table for each block
+        self._tables = (0, [])  # type: t.Tuple[int, t.List[t.Tuple[np.ndarray, np.ndarray]]]
+
+        # Every block value within max_distance // 4 bits of zero, to XOR with a query's blocks to find its neighbours
+        masks = np.arange(BLOCK_VALUES)
+        bits = _POPCOUNT[masks & 0xff] + _POPCOUNT[masks >> 8]
+        self._probes = masks[bits <= max_distance // len(BLOCK_SHIFTS)]
+
+    def __len__(self) -> int:
+        return int(self._hashes[0]) if self._hashes is not None else 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._keys) if self._keys is not None else 0
+
+    def open(self) -> None:
+        """
+        Maps the index files into memory, creating them if they don't exist yet, and builds the block tables
+
+        This reads through the whole index, so for large ones it should be run outside of the event loop
+        """
+        capacity = self._initial_capacity
+        if os.path.exists(self.path):
+            capacity = max(os.path.getsize(self.path) // 8 - HEADER, 1)
+
+        self._map(capacity)
+        self.rebuild()
+
+    def close(self) -> None:
+        self.flush()
+        self._hashes = self._keys = None
+        self._tables = (0, [])
+
+    def add(self, image_hash: int, key: str) -> None:
+        """
+        Adds a hash to the index, along with the key to return for it
+        """
+        if self._hashes is None or not self._informative(image_hash):
+            return
+
+        encoded = key.encode('ascii')
+        if len(encoded) > KEY_SIZE:
+            raise ValueError(f"Keys can't be longer than {KEY_SIZE} characters")
+
+        count = len(self)
+        if count >= self.capacity:
+            self._hashes.flush()
+            self._keys.flush()
+            self._map(self.capacity * 2)
+
+        self._hashes[HEADER + count] = image_hash
+        self._keys[count] = encoded
+        self._hashes[0] = count + 1
+
+    def search(self, image_hash: int, limit: int = 5) -> t.List[t.Tuple[int, str]]:
+        """
+        Finds the entries within max_distance bits of a hash, as (distance, key) pairs with the closest first
+        """
+        if self._hashes is None or not self._informative(image_hash):
+            return []
+
+        count = len(self)
+        covered, tables = self._tables
+        candidates = [np.arange(covered, count, dtype=np.uint32)]
+        for shift, (offsets, ids) in zip(BLOCK_SHIFTS, tables):
+            buckets = ((image_hash >> shift) & (BLOCK_VALUES - 1)) ^ self._probes
+            starts = offsets[buckets]
+            lengths = offsets[buckets + 1] - starts
+
+            # Gathers every bucket's entries at once, rather than slicing them out one bucket at a time
+            positions = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            candidates.append(ids[positions])
+
+        ids = np.concatenate(candidates).astype(np.intp)
+        distances = hamming_distances(self._hashes[HEADER:HEADER + count][ids], image_hash)
+
+        # Entries can turn up in more than one block, but only the close ones are worth de-duplicating
+        close = distances <= self.max_distance
+        ids, first = np.unique(ids[close], return_index=True)
+        distances = distances[close][first]
+
+        return [(int(distances[i]), self._keys[ids[i]].decode('ascii'))
+                for i in np.argsort(distances, kind='stable')[:limit]]
+
+    def rebuild(self) -> None:
+        """
+        Builds the block tables over every entry currently in the index
+
+        Searches can carry on while this runs, and keep using the previous tables until it's done
+        """
+        with self._lock:
+            if self._hashes is None:
+                return
+
+            count = len(self)
+            hashes = np.asarray(self._hashes[HEADER:HEADER + count])
+            tables = []
+            for shift in BLOCK_SHIFTS:
+                values = (hashes >> np.uint64(shift)).astype(np.uint16)
+                ids = np.argsort(values, kind='stable').astype(np.uint32)
+                offsets = np.concatenate(([0], np.cumsum(np.bincount(values, minlength=BLOCK_VALUES))))
+                tables.append((offsets, ids))
+
+            self._tables = (count, tables)
+
+    def flush(self) -> None:
+        """
+        Writes new entries out to disk, and folds them into the block tables once enough of them have built up
+        """
+        if self._hashes is None:
+            return
+
+        self._hashes.flush()
+        self._keys.flush()
+        if len(self) - self._tables[0] >= self.rebuild_after:
+            self.rebuild()
+
+    def _map(self, capacity: int) -> None:
+        for path, size in ((self.path, (capacity + HEADER) * 8), (self.keys_path, capacity * KEY_SIZE)):
+            with open(path, 'ab') as f:
+                f.truncate(max(size, os.path.getsize(path)))
+
+        self._hashes = np.memmap(self.path, dtype=np.uint64, mode='r+', shape=(capacity + HEADER,))
+        self._keys = np.memmap(self.keys_path, dtype=f'S{KEY_SIZE}', mode='r+', shape=(capacity,))
+
+    def _informative(self, image_hash: int) -> bool:
+        return self.MIN_BITS <= bin(image_hash).count('1') <= 64 - self.MIN_BITS
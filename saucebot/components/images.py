@@ -0,0 +1,174 @@
+import asyncio
+import concurrent.futures
+import io
+import typing as t
+
+import aiohttp
+import cachetools
+import pysaucenao
+import yarl
+from PIL import Image
+
+from saucebot.components import log, metrics
+from saucebot.components.addresses import check_url
+from saucebot.components.clients import clients
+from saucebot.components.config import config
+
+__all__ = ['PreparedImage', 'fetch', 'normalize', 'difference_hash', 'prepare', 'shutdown']
+
+
+_upload_config = config.get("upload", {})
+
+MAX_FETCH_BYTES = int(config.get("cache", {}).get("max_fetch_bytes", 10 * 1024 * 1024))
+MAX_DIMENSION = int(_upload_config.get("max_dimension", 512))
+JPEG_QUALITY = int(_upload_config.get("quality", 85))
+
+# Anything a server sends without a more specific type is left for Pillow to decide on
+ACCEPTED_TYPES = ('image/', 'application/octet-stream')
+
+# Redirects are followed by hand, so every hop can be checked before it's requested
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+_images_http_config = {**config.get("http", {}), **config.get("http", {}).get("images", {})}
+ALLOW_PRIVATE_ADDRESSES = bool(_images_http_config.get("allow_private_addresses", False))
+
+# Decoding and resizing is CPU bound, and Pillow releases the GIL while it does it, so a few threads are enough to
+# keep it off of the event loop without the cost of shipping images between processes
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=int(_upload_config.get("workers", 2)),
+                                                  thread_name_prefix="image")
+
+# Images downloaded in the last minute, so keying an image by its content and then uploading it only downloads it once
+_recent = cachetools.TTLCache(maxsize=int(_upload_config.get("recent_bytes", 64 * 1024 * 1024)), ttl=60,
+                              getsizeof=len)  # type: t.MutableMapping[str, bytes]
+
+
+class PreparedImage(t.NamedTuple):
+    """
+    An image as downloaded, the normalized copy of it to upload, and its perceptual hash
+    """
+    original: bytes
+    data: bytes
+    hash: int
+
+
+async def fetch(url: str) -> bytes:
+    """
+    Downloads the image at the supplied URL, refusing anything larger than MAX_FETCH_BYTES or that isn't an image
+
+    Only public http(s) links are followed, including for every redirect along the way. Raises ValueError if the
+    response is refused, before any more of it than necessary has been read
+    """
+    recent = _recent.get(url)
+    if recent is not None:
+        return recent
+
+    content = bytearray()
+    location = url
+    for _ in range(MAX_REDIRECTS + 1):
+        check_url(location, ALLOW_PRIVATE_ADDRESSES)
+        async with clients.session('images').get(location, allow_redirects=False) as response:
+            if response.status in REDIRECT_STATUSES and 'Location' in response.headers:
+                location = str(response.url.join(yarl.URL(response.headers['Location'])))
+                continue
+
+            response.raise_for_status()
+
+            content_type = response.headers.get('Content-Type', 'application/octet-stream').lower()
+            if not content_type.startswith(ACCEPTED_TYPES):
+                raise ValueError(f"Expected an image, got {content_type}")
+            if (response.content_length or 0) > MAX_FETCH_BYTES:
+                raise ValueError(f"Image exceeds {MAX_FETCH_BYTES} bytes")
+
+            async for chunk in response.content.iter_chunked(65536):
+                content.extend(chunk)
+                if len(content) > MAX_FETCH_BYTES:
+                    raise ValueError(f"Image exceeds {MAX_FETCH_BYTES} bytes")
+
+            break
+    else:
+        raise ValueError(f"Gave up after {MAX_REDIRECTS} redirects")
+
+    content = bytes(content)
+    if len(content) <= _recent.maxsize:
+        _recent[url] = content
+
+    return content
+
+
+def normalize(content: bytes, shrink: bool = True) -> t.Tuple[bytes, int]:
+    """
+    Shrinks an image down to a JPEG no larger than MAX_DIMENSION on either side, and computes its perceptual hash
+
+    SauceNao only compares a small thumbnail of whatever it's sent, so anything bigger is wasted bandwidth. Images
+    that are already small enough, or everything when shrink is False, are returned as they are. Raises ValueError
+    for anything Pillow can't decode.
+    """
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            if not shrink or (image.format == 'JPEG' and max(image.size) <= MAX_DIMENSION):
+                image.draft('L', (MAX_DIMENSION, MAX_DIMENSION))
+                return content, difference_hash(image)
+
+            # Let the JPEG decoder skip straight to a reduced size when it can, which is far cheaper than resizing
+            image.draft('RGB', (MAX_DIMENSION, MAX_DIMENSION))
+            image = image.convert('RGB')  # Also takes the first frame of animated images
+            image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), reducing_gap=2.0)
+
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+            image_hash = difference_hash(image)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Unable to decode image: {e}") from e
+
+    # Small PNGs and the like can come out larger as a JPEG
+    normalized = output.getvalue()
+    return (normalized if len(normalized) < len(content) else content), image_hash
+
+
+def difference_hash(image: Image.Image) -> int:
+    """
+    Computes a 64 bit difference hash of an image, which stays much the same through resizing and recompression
+
+    Each bit records whether a pixel is brighter than the one to its right, in a 9x8 grayscale copy of the image
+    """
+    pixels = image.convert('L').resize((9, 8), Image.Resampling.BOX).tobytes()
+
+    image_hash = 0
+    for row in range(0, 72, 9):
+        for i in range(row, row + 8):
+            image_hash = image_hash << 1 | (pixels[i] > pixels[i + 1])
+
+    return image_hash
+
+
+async def prepare(url: str, shrink: bool = True) -> PreparedImage:
+    """
+    Downloads and normalizes an image to be uploaded to SauceNao, or only hashes it when shrink is False
+
+    Raises pysaucenao.InvalidImageException for anything we can't upload, so it's refused before any quota is spent
+    """
+    try:
+        with metrics.stage_seconds.time(stage='download'):
+            original = await fetch(url)
+        with metrics.stage_seconds.time(stage='normalize'):
+            data, image_hash = await asyncio.get_running_loop().run_in_executor(_executor, normalize, original, shrink)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        metrics.upstream_errors.inc(upstream='images', exception=type(e).__name__)
+        log.debug("Unable to download %s: %s", None, url, e)
+        raise pysaucenao.InvalidImageException(str(e)) from e
+    except ValueError as e:
+        log.debug("Refusing to look up %s: %s", None, url, e)
+        raise pysaucenao.InvalidImageException(str(e)) from e
+
+    if shrink:
+        metrics.upload_bytes.inc(len(original), kind='original')
+        metrics.upload_bytes.inc(len(data), kind='uploaded')
+
+    return PreparedImage(original, data, image_hash)
+
+
+def shutdown() -> None:
+    """
+    Stops the worker threads once any images they're working on are done
+    """
+    _executor.shutdown(wait=True)
@@ -1,37 +1,65 @@
-import inspect
+import atexit
 import logging
+import logging.handlers
+import queue
+import sys
 import typing as t
 
 import hikari
 
 from saucebot.components.helpers import make_utf8_safe
 
-__all__ = ['debug', 'info', 'warning', 'error', 'exception']
+__all__ = ['debug', 'info', 'warning', 'error', 'exception', 'start_queue', 'stop_queue']
 
 
-def debug(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, **kwargs):
-    return logging.getLogger(get_module().__name__).debug(render_message(message, guild), **kwargs)
+_listener = None  # type: t.Optional[logging.handlers.QueueListener]
+_loggers = {}  # type: t.Dict[str, logging.Logger]
 
 
-def info(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, **kwargs):
-    return logging.getLogger(get_module().__name__).info(render_message(message, guild), **kwargs)
+def debug(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, *args, **kwargs):
+    logger = get_logger()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(_Message(message, guild, args), stacklevel=2, **kwargs)
 
 
-def warning(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, **kwargs):
-    return logging.getLogger(get_module().__name__).warning(render_message(message, guild), **kwargs)
+def info(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, *args, **kwargs):
+    logger = get_logger()
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(_Message(message, guild, args), stacklevel=2, **kwargs)
 
 
-def error(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, **kwargs):
-    return logging.getLogger(get_module().__name__).error(render_message(message, guild), **kwargs)
+def warning(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, *args, **kwargs):
+    logger = get_logger()
+    if logger.isEnabledFor(logging.WARNING):
+        logger.warning(_Message(message, guild, args), stacklevel=2, **kwargs)
 
 
-def exception(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, **kwargs):
-    return logging.getLogger(get_module().__name__).exception(render_message(message, guild), **kwargs)
+def error(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, *args, **kwargs):
+    logger = get_logger()
+    if logger.isEnabledFor(logging.ERROR):
+        logger.error(_Message(message, guild, args), stacklevel=2, **kwargs)
 
 
-def get_module():
-    stack = inspect.stack()[1]
-    return inspect.getmodule(stack[0])
+def exception(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None, *args, **kwargs):
+    logger = get_logger()
+    if logger.isEnabledFor(logging.ERROR):
+        logger.exception(_Message(message, guild, args), stacklevel=2, **kwargs)
+
+
+def get_logger() -> logging.Logger:
+    """
+    Gets the logger for the module that called into this one
+
+    Only the module name of the calling frame is looked up, so this costs about as much as a dict lookup, rather
+    than walking and reading the source of the entire stack like inspect.stack() does.
+    """
+    # noinspection PyProtectedMember
+    name = sys._getframe(2).f_globals.get('__name__', 'saucebot')
+    try:
+        return _loggers[name]
+    except KeyError:
+        _loggers[name] = logging.getLogger(name)
+        return _loggers[name]
 
 
 def render_message(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] = None):
@@ -39,5 +67,75 @@ def render_message(message: str, guild: t.Optional[t.Union[hikari.Guild, int]] =
         message = f"[{guild.name} ({guild.id})] {message}"
     elif isinstance(guild, int):
         message = f"[{guild}] {message}"
-        
+    elif guild is not None:
+        # Guilds we only know the ID of, such as when handling interactions over HTTP
+        message = f"[{guild.id}] {message}"
+
     return make_utf8_safe(message)
+
+
+class _Message:
+    """
+    Defers formatting the message, adding the guild prefix and sanitizing it until a handler actually formats the record
+
+    Any %-style args are applied here rather than by logging, so a % in a guild's name can't break formatting
+    """
+    __slots__ = ('message', 'guild', 'args')
+
+    def __init__(self, message: str, guild: t.Optional[t.Union[hikari.Guild, int]], args: tuple = ()):
+        self.message = message
+        self.guild = guild
+        self.args = args
+
+    def __str__(self) -> str:
+        return render_message(self.message % self.args if self.args else self.message, self.guild)
+
+
+def start_queue() -> None:
+    """
+    Moves the root loggers handlers onto a background thread, so writing logs never blocks the event loop
+
+    Records are handed to the thread through an unbounded queue and formatted there.
+    """
+    global _listener
+    if _listener:
+        return
+
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    if not handlers:
+        return
+
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+
+    _listener.start()
+    atexit.register(stop_queue)
+
+
+def stop_queue() -> None:
+    """
+    Flushes any queued records and stops the background thread
+    """
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler that leaves formatting to the listener thread
+
+    The stock QueueHandler formats records before queueing them, which would put that work back on the event loop.
+    Tracebacks are still rendered here though, so queued records don't hold on to every frame they reference.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
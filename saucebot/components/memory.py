@@ -0,0 +1,41 @@
+import os
+import resource
+import sys
+import typing as t
+
+import hikari
+
+__all__ = ['rss_bytes', 'cache_counts']
+
+
+def rss_bytes() -> int:
+    """
+    Gets the current resident set size of this process
+
+    Falls back to the peak RSS on platforms without /proc
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024  # Reported in kilobytes on Linux
+
+
+def cache_counts(cache: hikari.api.Cache) -> t.Dict[str, int]:
+    """
+    Counts the entries held in each of hikari's cache components
+    """
+    return {
+        'guilds': len(cache.get_guilds_view()),
+        'channels': len(cache.get_guild_channels_view()),
+        'roles': len(cache.get_roles_view()),
+        'emojis': len(cache.get_emojis_view()),
+        'stickers': len(cache.get_stickers_view()),
+        'members': sum(len(members) for members in cache.get_members_view().values()),
+        'presences': sum(len(presences) for presences in cache.get_presences_view().values()),
+        'voice_states': sum(len(states) for states in cache.get_voice_states_view().values()),
+        'messages': len(cache.get_messages_view()),
+        'invites': len(cache.get_invites_view()),
+        'users': len(cache.get_users_view()),
+    }
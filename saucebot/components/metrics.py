@@ -0,0 +1,195 @@
+import bisect
+import contextlib
+import time
+import typing as t
+from collections import Counter as _Counter
+
+from aiohttp import web
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'registry', 'render', 'start_server', 'cache_lookups',
+           'http_connections', 'queue_depth', 'queue_wait_seconds', 'stage_seconds', 'lookups', 'upstream_errors',
+           'resident_memory', 'cache_entries', 'speculative_lookups', 'upload_bytes']
+
+
+registry = []  # type: t.List[Counter]
+
+
+class Counter:
+    """
+    A simple monotonically increasing counter, optionally split up by a set of label values
+    """
+
+    TYPE = 'counter'
+
+    def __init__(self, name: str, description: str, labels: t.Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = _Counter()  # type: t.Counter[t.Tuple[str, ...]]
+
+        registry.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self.values[self._label_values(labels)] += amount
+
+    def get(self, **labels) -> float:
+        return self.values[self._label_values(labels)]
+
+    def render(self) -> t.List[str]:
+        """
+        Renders this metric in the Prometheus text exposition format
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{self._format_labels(label_values)} {_format_value(value)}")
+
+        return lines
+
+    def _label_values(self, labels: dict) -> t.Tuple[str, ...]:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, label_values: t.Tuple[str, ...], extra: t.Sequence[t.Tuple[str, str]] = ()) -> str:
+        pairs = list(zip(self.labels, label_values)) + list(extra)
+        if not pairs:
+            return ''
+
+        escaped = (v.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down, such as the length of a queue
+    """
+
+    TYPE = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._label_values(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.values[self._label_values(labels)] -= amount
+
+
+class Histogram(Counter):
+    """
+    Counts observed values into cumulative buckets, such as request durations in seconds
+    """
+
+    TYPE = 'histogram'
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self, name: str, description: str, labels: t.Sequence[str] = (),
+                 buckets: t.Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = {}  # type: t.Dict[t.Tuple[str, ...], t.List[int]]
+        self.sums = _Counter()  # type: t.Counter[t.Tuple[str, ...]]
+
+    def observe(self, value: float, **labels) -> None:
+        label_values = self._label_values(labels)
+        if label_values not in self.counts:
+            self.counts[label_values] = [0] * (len(self.buckets) + 1)
+
+        # The last slot holds values above the largest bucket (+Inf)
+        self.counts[label_values][bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[label_values] += value
+        self.values[label_values] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels) -> t.Iterator[None]:
+        """
+        Observes the wall clock time spent inside the block, whether or not it raises
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> t.List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        for label_values, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _format_value(bucket)
+                lines.append(f"{self.name}_bucket{self._format_labels(label_values, [('le', le)])} {cumulative}")
+
+            lines.append(f"{self.name}_sum{self._format_labels(label_values)} {_format_value(self.sums[label_values])}")
+            lines.append(f"{self.name}_count{self._format_labels(label_values)} {cumulative}")
+
+        return lines
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render() -> str:
+    """
+    Renders every registered metric in the Prometheus text exposition format
+    """
+    return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+async def _metrics_handler(_request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type='text/plain', charset='utf-8',
+                        headers={'Cache-Control': 'no-cache'})
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    """
+    Serves the metrics registry at /metrics for Prometheus to scrape, returning the runner so it can be cleaned up
+    """
+    app = web.Application()
+    app.router.add_get('/metrics', _metrics_handler)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+# Sauce cache lookups, split up by the type of key the image resolved to (attachment, content or url), and lookups in
+# the near duplicate index
+cache_lookups = Counter('saucebot_cache_lookups_total', 'Sauce cache lookups by key type and result',
+                        labels=('key_type', 'result'))
+
+# HTTP connections opened to each upstream service, and whether they were new or reused from the keep-alive pool
+http_connections = Counter('saucebot_http_connections_total', 'HTTP connections used by upstream and reuse',
+                           labels=('upstream', 'reused'))
+
+# Lookups waiting on SauceNao quota, and how long they ended up waiting
+queue_depth = Gauge('saucebot_lookup_queue_depth', 'Lookups waiting for SauceNao quota', labels=('pool',))
+queue_wait_seconds = Histogram('saucebot_lookup_queue_wait_seconds', 'Time lookups spent waiting for SauceNao quota',
+                               labels=('pool',))
+
+# Time spent in each stage of a sauce lookup, from the initial defer to the final response
+stage_seconds = Histogram('saucebot_stage_seconds', 'Time spent in each stage of a sauce lookup', labels=('stage',))
+
+# Completed sauce commands by command and how they ended (found, not_found, cached, or the exception raised)
+lookups = Counter('saucebot_lookups_total', 'Sauce commands by command and outcome', labels=('command', 'outcome'))
+
+# Failed requests to each upstream service, by the exception they raised
+upstream_errors = Counter('saucebot_upstream_errors_total', 'Failed upstream requests by upstream and exception type',
+                          labels=('upstream', 'exception'))
+
+# Process memory, and the number of entries held in each of hikari's cache components
+resident_memory = Gauge('saucebot_resident_memory_bytes', 'Resident set size of the bot process')
+cache_entries = Gauge('saucebot_gateway_cache_entries', 'Entries held in the gateway cache by component',
+                      labels=('component',))
+
+# Images looked up in the background while the user was picking one: hit (finished before they picked it),
+# joined (still running when they picked it), wasted (finished but not picked), cancelled, failed, cached or skipped
+speculative_lookups = Counter('saucebot_speculative_lookups_total', 'Speculative lookups by how they turned out',
+                              labels=('result',))
+
+# Size of the images we've uploaded to SauceNao ourselves, as downloaded (original) and as sent (uploaded)
+upload_bytes = Counter('saucebot_upload_bytes_total', 'Bytes of images uploaded to SauceNao before and after resizing',
+                       labels=('kind',))
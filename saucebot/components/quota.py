@@ -0,0 +1,467 @@
+import asyncio
+import math
+import time
+import typing as t
+from collections import deque, Counter, OrderedDict
+
+import cachetools
+import pysaucenao
+from pysaucenao.containers import SauceNaoResults
+
+from saucebot.components import cluster, log, metrics
+from saucebot.components.config import config
+
+__all__ = ['ApiKey', 'FairShare', 'KeyPool', 'requester_id', 'public_pool', 'guild_pool']
+
+
+SHORT_WINDOW = 30.0
+DAILY_PARK = float(config["saucenao"].get("daily_park", 3600.0))
+QUEUE_TIMEOUT = float(config["saucenao"].get("queue_timeout", 600.0))
+
+_fair_share_config = config.get("fair_share", {})
+
+
+class ApiKey:
+    """
+    Tracks the remaining SauceNao quota for a single API key
+
+    SauceNao reports how many searches are left in the short (30 second) and long (24 hour) windows with every
+    response. Between responses we subtract any searches still in flight, and assume the short window has refilled
+    once it has been long enough since we last heard from it.
+    """
+
+    def __init__(self, token: str):
+        self.token = token
+        self.short_limit = None  # type: t.Optional[int]
+        self.short_remaining = None  # type: t.Optional[int]
+        self.long_limit = None  # type: t.Optional[int]
+        self.long_remaining = None  # type: t.Optional[int]
+        self.updated_at = 0.0
+        self.parked_until = 0.0
+        self.in_flight = 0
+
+    def __str__(self):
+        return f"{self.token[:6]}…"
+
+    def headroom(self, now: t.Optional[float] = None) -> float:
+        """
+        Estimates how many more searches this key can make right now
+        """
+        now = now or time.monotonic()
+        if now < self.parked_until:
+            return 0
+
+        # Keys we haven't used yet are assumed to be fresh
+        if self.long_remaining is None:
+            return float('inf')
+
+        short_remaining = self.short_remaining
+        if now - self.updated_at >= SHORT_WINDOW and self.short_limit:
+            short_remaining = self.short_limit
+
+        return max(min(short_remaining, self.long_remaining) - self.in_flight, 0)
+
+    def update(self, results: SauceNaoResults) -> None:
+        self.short_limit = int(results.short_limit)
+        self.short_remaining = int(results.short_remaining)
+        self.long_limit = int(results.long_limit)
+        self.long_remaining = int(results.long_remaining)
+        self.updated_at = time.monotonic()
+
+        if self.long_remaining <= 0:
+            log.warning(f"API key {self} has used up its daily limit, parking it for {DAILY_PARK:.0f} seconds")
+            self.park(DAILY_PARK)
+
+    def available_at(self, now: float) -> float:
+        """
+        Estimates when this key will next be able to make a search
+        """
+        if now < self.parked_until:
+            return self.parked_until
+
+        if self.headroom(now):
+            return now
+
+        # Either the short window needs to roll over, or we're waiting on searches in flight to report back
+        return self.updated_at + SHORT_WINDOW if self.updated_at + SHORT_WINDOW > now else now + SHORT_WINDOW
+
+    def park(self, seconds: float) -> None:
+        """
+        Takes this key out of rotation for the specified amount of time
+
+        Once the key comes back its remaining quota is unknown, so the next search acts as a probe
+        """
+        self.parked_until = time.monotonic() + seconds
+        self.short_remaining = self.long_remaining = None
+
+
+class FairShare:
+    """
+    Divides a key pools daily quota between the guilds using it
+
+    Every guild that has made a search in the last 24 hours is considered active, and is entitled to a share of the
+    pools daily limit in proportion to its weight. Guilds that have used up their share are refused until their
+    usage falls back out of the window, so a single busy guild can't drain the quota for everyone else.
+
+    Searches made in DMs are tracked per user instead, under the negated user ID (see requester_id), so each user gets
+    their own share at dm_weight rather than every DM user splitting a single guild's share.
+
+    When running as a cluster, each worker only sees the guilds on its own shards, so it divides up an equal part of
+    the budget between them.
+    """
+
+    def __init__(self, weights: t.Dict[int, float], default_weight: float = 1.0, min_daily: int = 0,
+                 default_budget: int = 100, dm_weight: float = 0.25):
+        self.weights = weights
+        self.default_weight = default_weight
+        self.min_daily = min_daily
+        self.default_budget = default_budget
+        self.dm_weight = dm_weight
+
+        # Searches made by each guild, bucketed by the hour they were made in
+        self._usage = {}  # type: t.Dict[int, t.Counter[int]]
+
+        # Active guilds ordered by the hour they last searched in, so inactive ones can be expired from the front
+        # without looking at the rest, along with the running total of their weights
+        self._active = OrderedDict()  # type: t.OrderedDict[int, int]
+        self._total_weight = 0.0
+
+    def weight(self, guild_id: int) -> float:
+        if guild_id < 0:
+            return self.dm_weight
+
+        return self.weights.get(guild_id, self.default_weight)
+
+    def record(self, guild_id: int) -> None:
+        hour = self._hour()
+        self._usage.setdefault(guild_id, Counter())[hour] += 1
+
+        if guild_id not in self._active:
+            self._total_weight += self.weight(guild_id)
+        self._active[guild_id] = hour
+        self._active.move_to_end(guild_id)
+
+    def usage(self, guild_id: int) -> int:
+        self._expire(guild_id)
+        return sum(self._usage.get(guild_id, {}).values())
+
+    def share(self, guild_id: int, keys: t.List[ApiKey]) -> float:
+        """
+        Gets the number of searches the guild is entitled to over a 24-hour window
+        """
+        budget = sum(key.long_limit or self.default_budget for key in keys) / cluster.worker_count
+        self._expire_inactive()
+
+        total_weight = self._total_weight
+        if guild_id not in self._active:
+            total_weight += self.weight(guild_id)
+
+        return max(budget * self.weight(guild_id) / total_weight, self.min_daily)
+
+    def _expire(self, guild_id: int) -> None:
+        if guild_id not in self._usage:
+            return
+
+        oldest = self._hour() - 23
+        usage = self._usage[guild_id]
+        for hour in [hour for hour in usage if hour < oldest]:
+            del usage[hour]
+
+    def _expire_inactive(self) -> None:
+        oldest = self._hour() - 23
+        while self._active:
+            guild_id, last_hour = next(iter(self._active.items()))
+            if last_hour >= oldest:
+                break
+
+            del self._active[guild_id]
+            self._usage.pop(guild_id, None)
+            self._total_weight -= self.weight(guild_id)
+
+        # Don't let rounding errors build up across every guild that has come and gone
+        if not self._active:
+            self._total_weight = 0.0
+
+    @staticmethod
+    def _hour() -> int:
+        return int(time.time() // 3600)
+
+
+def requester_id(guild_id: t.Optional[int], user_id: int) -> int:
+    """
+    Gets the ID a search is queued and shared out under: the guild it was made in, or the negated user ID in DMs
+    """
+    return guild_id if guild_id else -user_id
+
+
+class _Waiter:
+    def __init__(self, guild_id: int, deadline: float, on_position: t.Optional[t.Callable[[int], t.Awaitable]]):
+        self.guild_id = guild_id
+        self.deadline = deadline
+        self.on_position = on_position
+        self.position = 0
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class KeyPool:
+    """
+    Routes SauceNao searches to whichever API key in the pool has the most quota left
+
+    Keys that hit their short or daily limits are parked until their quota should have recovered, and the search is
+    retried on the next best key. When every key is out of quota, searches wait in per-guild queues until one frees
+    up. The queues are served by weighted deficit round robin, so a burst from one guild can't hold up everyone else,
+    and searches are only failed if they won't get a key before their deadline.
+    """
+
+    def __init__(self, name: str, tokens: t.Iterable[str], fair_share: t.Optional[FairShare] = None):
+        self.name = name
+        self.keys = [ApiKey(token) for token in dict.fromkeys(tokens)]
+        self.fair_share = fair_share
+
+        self._queues = {}  # type: t.Dict[int, t.Deque[_Waiter]]
+        self._rotation = deque()  # type: t.Deque[int]
+        self._deficits = {}  # type: t.Dict[int, float]
+        self._released = asyncio.Event()
+        self._queue_task = None  # type: t.Optional[asyncio.Task]
+        self._notices = set()  # type: t.Set[asyncio.Task]
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def headroom(self) -> float:
+        now = time.monotonic()
+        return sum(key.headroom(now) for key in self.keys)
+
+    def available(self, guild_id: int = 0) -> float:
+        """
+        Estimates how many searches a guild could start right now, without waiting in line or going over its share
+        """
+        available = self.headroom() if not self._queues else 0
+        if self.fair_share:
+            share = self.fair_share.share(guild_id, self.keys) - self.fair_share.usage(guild_id)
+            available = min(available, share)
+
+        return max(available, 0)
+
+    def acquire(self) -> ApiKey:
+        """
+        Gets the key with the most headroom, raising the relevant limit exception if every key is exhausted
+        """
+        now = time.monotonic()
+        key = max(self.keys, key=lambda k: k.headroom(now))
+        if not key.headroom(now):
+            raise self._limit_exception(now)
+
+        key.in_flight += 1
+        return key
+
+    def release(self, key: ApiKey) -> None:
+        key.in_flight -= 1
+        self._released.set()
+
+    async def wait_for_key(self, guild_id: int, deadline: float,
+                           on_position: t.Optional[t.Callable[[int], t.Awaitable]] = None) -> ApiKey:
+        """
+        Gets the key with the most headroom, waiting in line for quota to free up if every key is exhausted
+
+        on_position is called with the searches estimated place in the queue whenever it changes
+        """
+        if self.fair_share and self.fair_share.usage(guild_id) >= self.fair_share.share(guild_id, self.keys):
+            log.info(f"Guild has used up its share of the {self.name} key pool", guild_id)
+            raise pysaucenao.DailyLimitReachedException("This guild has used up its share of the daily limit")
+
+        if not self._queues:
+            try:
+                return self.acquire()
+            except (pysaucenao.ShortLimitReachedException, pysaucenao.DailyLimitReachedException):
+                pass
+
+        waiter = _Waiter(guild_id, deadline, on_position)
+        if guild_id not in self._queues:
+            self._queues[guild_id] = deque()
+            self._deficits[guild_id] = 0.0
+            self._rotation.append(guild_id)
+        self._queues[guild_id].append(waiter)
+
+        if not self._queue_task or self._queue_task.done():
+            self._queue_task = asyncio.create_task(self._run_queue())
+
+        log.debug("Queued a search on the %s key pool (%d waiting)", guild_id, self.name, len(self))
+        queued_at = time.monotonic()
+        try:
+            return await waiter.future
+        except asyncio.CancelledError:
+            # We may have been handed a key just before being cancelled
+            if waiter.future.done() and not waiter.future.cancelled() and not waiter.future.exception():
+                self.release(waiter.future.result())
+            raise
+        finally:
+            metrics.queue_wait_seconds.observe(time.monotonic() - queued_at, pool=self.name)
+
+    async def run(self, search: t.Callable[[str], t.Awaitable[SauceNaoResults]], guild_id: int = 0,
+                  deadline: t.Optional[float] = None,
+                  on_position: t.Optional[t.Callable[[int], t.Awaitable]] = None) -> SauceNaoResults:
+        """
+        Runs a search with the best available key, moving on to the next key if one turns out to be exhausted
+        """
+        deadline = deadline or time.monotonic() + QUEUE_TIMEOUT
+        while True:
+            key = await self.wait_for_key(guild_id, deadline, on_position)
+            try:
+                results = await search(key.token)
+            except pysaucenao.ShortLimitReachedException:
+                log.info(f"API key {key} reached its short limit, parking it for {SHORT_WINDOW:.0f} seconds")
+                key.park(SHORT_WINDOW)
+                continue
+            except pysaucenao.DailyLimitReachedException:
+                log.warning(f"API key {key} reached its daily limit, parking it for {DAILY_PARK:.0f} seconds")
+                key.park(DAILY_PARK)
+                continue
+            finally:
+                self.release(key)
+
+            key.update(results)
+            if self.fair_share:
+                self.fair_share.record(guild_id)
+
+            return results
+
+    async def _run_queue(self) -> None:
+        """
+        Hands keys out to queued searches as quota frees up
+        """
+        while self._queues:
+            # Serve waiters for as long as there's quota
+            while True:
+                waiter = self._next_waiter()
+                if not waiter:
+                    break
+
+                try:
+                    key = self.acquire()
+                except (pysaucenao.ShortLimitReachedException, pysaucenao.DailyLimitReachedException):
+                    break
+
+                self._deficits[waiter.guild_id] -= 1
+                self._dequeue(waiter, served=True)
+                waiter.future.set_result(key)
+
+            # Anyone whose deadline will pass before a key frees up can be told so now instead of later
+            now = time.monotonic()
+            available_at = min((key.available_at(now) for key in self.keys), default=float('inf'))
+            for queue in list(self._queues.values()):
+                for waiter in list(queue):
+                    if waiter.deadline < available_at and not waiter.future.done():
+                        self._dequeue(waiter)
+                        waiter.future.set_exception(self._limit_exception(now))
+
+            metrics.queue_depth.set(len(self), pool=self.name)
+            if not self._queues:
+                break
+
+            self._report_positions()
+
+            # Sleep until a key should have quota again, or until a search finishes and releases one
+            self._released.clear()
+            try:
+                await asyncio.wait_for(self._released.wait(), timeout=max(available_at - time.monotonic(), 0.05))
+            except asyncio.TimeoutError:
+                pass
+
+        metrics.queue_depth.set(0, pool=self.name)
+
+    def _next_waiter(self) -> t.Optional[_Waiter]:
+        """
+        Picks the next waiter to serve using deficit round robin
+
+        Each time a guild comes around in the rotation its deficit is topped up by its weight, and it can be served
+        once for every whole search of deficit it has built up
+        """
+        while self._rotation:
+            guild_id = self._rotation[0]
+            queue = self._queues[guild_id]
+            while queue and queue[0].future.done():  # Cancelled while waiting
+                self._dequeue(queue[0])
+                if guild_id not in self._queues:
+                    break
+
+            if guild_id not in self._queues:
+                continue
+
+            if self._deficits[guild_id] >= 1:
+                return queue[0]
+
+            self._deficits[guild_id] += self._weight(guild_id)
+            if self._deficits[guild_id] < 1:
+                self._rotation.rotate(-1)
+
+        return None
+
+    def _dequeue(self, waiter: _Waiter, served: bool = False) -> None:
+        guild_id = waiter.guild_id
+        queue = self._queues[guild_id]
+        queue.remove(waiter)
+
+        if not queue:
+            del self._queues[guild_id]
+            del self._deficits[guild_id]
+            self._rotation.remove(guild_id)
+
+        # Move on to the next guild once this one has used up its deficit for the round
+        elif served and self._deficits[guild_id] < 1 and self._rotation[0] == guild_id:
+            self._rotation.rotate(-1)
+
+    def _weight(self, guild_id: int) -> float:
+        return max(self.fair_share.weight(guild_id), 0.01) if self.fair_share else 1.0
+
+    def _report_positions(self) -> None:
+        """
+        Estimates each waiter's place in line from how many searches every guild gets per round
+        """
+        for guild_id, queue in self._queues.items():
+            weight = self._weight(guild_id)
+            for index, waiter in enumerate(queue):
+                rounds = (index + 1) / weight
+                position = sum(min(len(other), math.ceil(rounds * self._weight(other_id)))
+                               for other_id, other in self._queues.items())
+
+                if waiter.position != position and waiter.on_position:
+                    waiter.position = position
+                    notice = asyncio.create_task(waiter.on_position(position))
+                    self._notices.add(notice)
+                    notice.add_done_callback(self._notice_done)
+
+    def _notice_done(self, notice: asyncio.Task) -> None:
+        self._notices.discard(notice)
+        if not notice.cancelled() and notice.exception():
+            log.warning(f"Failed to send a queue position update: {notice.exception()}")
+
+    def _limit_exception(self, now: float) -> pysaucenao.SauceNaoException:
+        if all(k.parked_until - now > SHORT_WINDOW for k in self.keys):
+            return pysaucenao.DailyLimitReachedException("All API keys have exhausted their daily limits")
+        return pysaucenao.ShortLimitReachedException("All API keys have exhausted their short limits")
+
+
+# The public keys are shared by every guild that hasn't registered its own
+_public_tokens = list(config["saucenao"].get("tokens", []))
+if config["saucenao"].get("token"):
+    _public_tokens.insert(0, config["saucenao"]["token"])
+
+public_pool = KeyPool('public', _public_tokens, FairShare(
+    weights={int(guild_id): float(weight) for guild_id, weight in _fair_share_config.get("weights", {}).items()},
+    default_weight=float(_fair_share_config.get("default_weight", 1.0)),
+    min_daily=int(_fair_share_config.get("min_daily", 20)),
+    default_budget=int(_fair_share_config.get("default_budget", 100)),
+    dm_weight=float(_fair_share_config.get("dm_weight", 0.25))
+))
+_guild_pools = cachetools.LRUCache(maxsize=1024)  # type: t.MutableMapping[str, KeyPool]
+
+
+def guild_pool(token: str) -> KeyPool:
+    """
+    Gets the single key pool for a guild's own API key, so its quota is tracked the same way as the public keys
+    """
+    if token not in _guild_pools:
+        _guild_pools[token] = KeyPool('guild', [token])
+
+    return _guild_pools[token]
@@ -0,0 +1,217 @@
+import asyncio
+import typing as t
+
+import hikari
+import lightbulb
+import sentry_sdk
+
+from saucebot.components import embeds, log
+from saucebot.components.config import config
+from saucebot.components.errors import error_embeds
+
+__all__ = ['InteractionContext', 'InteractionGuild', 'Route', 'CommandRouter']
+
+
+class InteractionGuild(t.NamedTuple):
+    """
+    Stands in for the cached guild a gateway bot would have, as interactions only tell us the guild's ID
+    """
+    id: hikari.Snowflake
+
+
+class Route(t.NamedTuple):
+    command: lightbulb.CommandLike
+    ephemeral: bool = False
+    guild_only: bool = False
+    permissions: hikari.Permissions = hikari.Permissions.NONE
+
+
+class _Options(dict):
+    """
+    Command options by name, readable as attributes like lightbulb's, with missing options read as None
+    """
+    def __getattr__(self, name: str) -> t.Any:
+        return self.get(name)
+
+
+class InteractionContext:
+    """
+    Provides the parts of lightbulb's application command context our commands use, for interactions received over HTTP
+
+    The HTTP response to an interaction is always a deferral, sent as soon as the command makes its first response (or
+    runs for too long without making one). Everything the command responds with is sent through the REST API instead,
+    following the same rules as lightbulb: the first response after a deferral edits it, and the rest are follow-ups.
+    """
+
+    def __init__(self, app: hikari.RESTBot, interaction: hikari.CommandInteraction, route: Route, options: _Options):
+        self.app = app
+        self.interaction = interaction
+        self.command = route.command
+        self.options = options
+        self._ephemeral = route.ephemeral
+        self._deferral = asyncio.get_running_loop().create_future()  # type: asyncio.Future[hikari.MessageFlag]
+        self._deferred = False
+
+    @property
+    def author(self) -> hikari.User:
+        return self.interaction.user
+
+    @property
+    def member(self) -> t.Optional[hikari.InteractionMember]:
+        return self.interaction.member
+
+    @property
+    def guild_id(self) -> t.Optional[hikari.Snowflake]:
+        return self.interaction.guild_id
+
+    @property
+    def channel_id(self) -> hikari.Snowflake:
+        return self.interaction.channel_id
+
+    def get_guild(self) -> t.Optional[InteractionGuild]:
+        return InteractionGuild(self.guild_id) if self.guild_id else None
+
+    def defer(self, flags: hikari.MessageFlag) -> None:
+        """
+        Marks the interaction as deferred, to be sent as the HTTP response
+        """
+        if not self._deferral.done():
+            self._deferral.set_result(flags)
+            self._deferred = True
+
+    async def respond(self, *args, **kwargs) -> t.Optional[hikari.Message]:
+        response_type = hikari.ResponseType.MESSAGE_CREATE
+        if args and isinstance(args[0], hikari.ResponseType):
+            response_type, args = args[0], args[1:]
+
+        flags = kwargs.pop('flags', hikari.UNDEFINED)
+        if flags is hikari.UNDEFINED:
+            flags = hikari.MessageFlag.EPHEMERAL if self._ephemeral else hikari.MessageFlag.NONE
+
+        if not self._deferral.done():
+            self.defer(flags)
+            if response_type is hikari.ResponseType.DEFERRED_MESSAGE_CREATE:
+                return None
+
+        if self._deferred:
+            self._deferred = False
+            return await self._edit_initial_response(*args, **kwargs)
+
+        return await self.interaction.execute(*args, flags=flags, **kwargs)
+
+    async def _edit_initial_response(self, *args, **kwargs) -> hikari.Message:
+        # We can't tell when Discord has received the deferral we returned, so an edit made straight after it may
+        # arrive first and not find the response yet
+        for delay in (0.25, 0.5, 1.0):
+            try:
+                return await self.interaction.edit_initial_response(*args, **kwargs)
+            except hikari.NotFoundError:
+                await asyncio.sleep(delay)
+
+        return await self.interaction.edit_initial_response(*args, **kwargs)
+
+
+class CommandRouter:
+    """
+    Runs lightbulb commands for interactions received by a hikari RESTBot
+    """
+
+    def __init__(self, app: hikari.RESTBot, defer_after: float = 2.0):
+        self.app = app
+        self.defer_after = defer_after
+        self._routes = {}  # type: t.Dict[t.Tuple[hikari.CommandType, t.Tuple[str, ...]], Route]
+        self._running = set()  # type: t.Set[asyncio.Task]
+
+    def add(self, command_type: hikari.CommandType, path: t.Sequence[str], command: lightbulb.CommandLike,
+            **kwargs) -> None:
+        """
+        Routes interactions for the command at the given path (such as ("sauce", "url")) to a command's callback
+        """
+        self._routes[(command_type, tuple(path))] = Route(command, **kwargs)
+
+    async def on_command(self, interaction: hikari.CommandInteraction) -> hikari.api.InteractionResponseBuilder:
+        """
+        Starts running the command for an interaction, returning the deferral to respond to the HTTP request with
+        """
+        path, options = self._parse(interaction)
+        route = self._routes.get((interaction.command_type, path))
+        if not route:
+            log.warning(f"Received an interaction for an unknown command: {' '.join(path)}", interaction.guild_id)
+            return interaction.build_response().add_embed(
+                embeds.error(message="This command isn't available right now")
+            ).set_flags(hikari.MessageFlag.EPHEMERAL)
+
+        ctx = InteractionContext(self.app, interaction, route, options)
+        task = asyncio.create_task(self._invoke(ctx, route))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+        # Wait for the command to respond for as long as we safely can, so it can decide whether to respond ephemerally
+        await asyncio.wait([ctx._deferral, task], timeout=self.defer_after, return_when=asyncio.FIRST_COMPLETED)
+        ctx.defer(hikari.MessageFlag.EPHEMERAL if route.ephemeral else hikari.MessageFlag.NONE)
+        return interaction.build_deferred_response().set_flags(ctx._deferral.result())
+
+    async def close(self) -> None:
+        """
+        Waits for any commands that are still running to finish
+        """
+        if self._running:
+            await asyncio.wait(self._running)
+
+    async def _invoke(self, ctx: InteractionContext, route: Route) -> None:
+        try:
+            self._check(ctx, route)
+            await route.command.callback(ctx)
+        except Exception as e:
+            # Like lightbulb, anything other than its own errors is an unexpected failure in the command itself
+            _embeds = error_embeds(e) if isinstance(e, lightbulb.LightbulbError) else None
+            if _embeds is None:
+                log.exception(f"An unknown error occurred: {e}", exc_info=e)
+                if not config["bot"]["in_dev"]:
+                    sentry_sdk.capture_exception(e)
+
+                return
+
+            await ctx.respond(embeds=_embeds)
+
+    @staticmethod
+    def _check(ctx: InteractionContext, route: Route) -> None:
+        """
+        Checks that the command can be run here, as lightbulb's own checks rely on the gateway cache
+        """
+        if route.guild_only and not ctx.guild_id:
+            raise lightbulb.errors.OnlyInGuild("This command can only be used in a guild")
+
+        if route.permissions and ctx.member:
+            # Interactions come with the member's permissions in the channel they were used in
+            permissions = ctx.member.permissions
+            missing = route.permissions & ~permissions
+            if missing and not permissions & hikari.Permissions.ADMINISTRATOR:
+                raise lightbulb.errors.MissingRequiredPermission(
+                    "You are missing one or more permissions required in order to run this command", perms=missing
+                )
+
+    @staticmethod
+    def _parse(interaction: hikari.CommandInteraction) -> t.Tuple[t.Tuple[str, ...], _Options]:
+        """
+        Works out which (sub)command an interaction is for and resolves its options
+        """
+        options = _Options()
+        if interaction.command_type is hikari.CommandType.MESSAGE:
+            options['target'] = interaction.resolved.messages[interaction.target_id]
+            return (interaction.command_name,), options
+
+        path = [interaction.command_name]
+        interaction_options = interaction.options or []
+        while interaction_options and interaction_options[0].type in (hikari.OptionType.SUB_COMMAND,
+                                                                      hikari.OptionType.SUB_COMMAND_GROUP):
+            path.append(interaction_options[0].name)
+            interaction_options = interaction_options[0].options or []
+
+        for option in interaction_options:
+            if option.type is hikari.OptionType.ATTACHMENT:
+                options[option.name] = interaction.resolved.attachments[hikari.Snowflake(option.value)]
+            else:
+                options[option.name] = option.value
+
+        return tuple(path), options
@@ -0,0 +1,57 @@
+import asyncio
+import typing as t
+
+from saucebot.components import log
+
+__all__ = ['SingleFlight']
+
+
+T = t.TypeVar('T')
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single shared call
+
+    The first caller for a key starts the work in its own task, and anyone else asking for the same key while it's
+    still running awaits that same task. Results and exceptions are passed on to every waiter, but nothing is
+    remembered once the call completes; caching results is left up to the caller.
+
+    A waiter being cancelled only cancels the shared call if nobody else is still waiting on it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}  # type: t.Dict[t.Hashable, t.Tuple[asyncio.Task, t.List[int]]]
+
+    async def run(self, key: t.Hashable, func: t.Callable[[], t.Awaitable[T]]) -> T:
+        if key in self._calls:
+            log.debug("Joining in-flight %s call for %s", None, self.name, key)
+            task, waiters = self._calls[key]
+        else:
+            task, waiters = asyncio.ensure_future(func()), [0]
+            self._calls[key] = (task, waiters)
+            task.add_done_callback(lambda _: self._forget(key, task))
+
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if waiters[0] == 1 and not task.done():
+                log.debug("Last waiter for %s call %s was cancelled, cancelling the call", None, self.name, key)
+                task.cancel()
+                self._forget(key, task)
+            raise
+        finally:
+            waiters[0] -= 1
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: t.Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key, (None,))[0] is task:
+            del self._calls[key]
+
+        # Make sure exceptions nobody ended up waiting around for don't get reported as never retrieved
+        if task.done() and not task.cancelled():
+            task.exception()
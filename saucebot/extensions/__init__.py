@@ -1,4 +1,5 @@
 extensions = [
     "saucebot.extensions.sauce",
-    "saucebot.extensions.settings"
+    "saucebot.extensions.settings",
+    "saucebot.extensions.misc"
 ]
@@ -0,0 +1,32 @@
+import humanize
+import lightbulb
+
+from saucebot.components import embeds
+from saucebot.components.helpers import codewrap
+from saucebot.lang.lang import lang
+from saucebot.models.servers import Servers
+
+misc = lightbulb.Plugin("Misc")
+
+
+@misc.command()
+@lightbulb.command("help", "Learn how to find the source of images posted in this server!", ephemeral=True)
+@lightbulb.implements(lightbulb.SlashCommand)
+async def bot_help(ctx: lightbulb.SlashContext):
+    embed = embeds.base_embed()
+    embed.title = lang('Misc', 'info_title')
+    embed.description = lang('Misc', 'info_desc')
+
+    query_count = await Servers.count_queries()
+    embed.url = "https://www.patreon.com/saucebot"
+    embed.add_field("Sauce queries processed", codewrap(humanize.intcomma(query_count)))
+    await ctx.respond(embed)
+
+
+# Extension methods
+def load(_bot: lightbulb.BotApp):
+    _bot.add_plugin(misc)
+
+
+def unload(_bot: lightbulb.BotApp):
+    _bot.remove_plugin(misc)
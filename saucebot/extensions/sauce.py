@@ -1,33 +1,110 @@
-import hashlib
-import re
+import asyncio
 import typing as t
-from datetime import date
 
-import anilist
-import cachetools as cachetools
+import cachetools
 import hikari
 import lightbulb
 import pysaucenao
-from pysaucenao import SauceNao
-
-from saucebot.components import log, embeds
+from lightbulb.ext import tasks
+from sqlalchemy.exc import SQLAlchemyError
+
+from saucebot.components import cluster, log, embeds, images, metrics
+from saucebot.components.anilist import AniListRecord, process_media, serialize_record, deserialize_record
+from saucebot.components.cache import MISSING, TieredCache, cache_key, content_key, key_type, serialize_results, \
+    deserialize_results
+from saucebot.components.clients import clients
 from saucebot.components.config import config
-from saucebot.components.helpers import escape_markdown, truncate, codewrap
-from saucebot.lang.lang import lang
-from saucebot.modals.sauce.results import SauceResultsView
+from saucebot.components.cooldowns import SharedCooldownManager
+from saucebot.components.hashindex import HashIndex
+from saucebot.components.helpers import codewrap
+from saucebot.components.quota import KeyPool, requester_id, public_pool, guild_pool
+from saucebot.components.restbot import InteractionContext
+from saucebot.components.singleflight import SingleFlight
+from saucebot.lang.lang import lang, set_language, current_language
+from saucebot.modals.sauce.gallery import SauceGalleryView
+from saucebot.modals.sauce.results import SauceResultsView, result_links
 from saucebot.modals.sauce.select import SelectTemplateView
 from saucebot.models.servers import Servers
 
 sauce_plugin = lightbulb.Plugin("SauceNao")
-user_cooldowns = lightbulb.CooldownManager(lambda ctx: lightbulb.UserBucket(300.0, 6))  # 6/5 minutes
-guild_cooldowns = lightbulb.CooldownManager(lambda ctx: lightbulb.GuildBucket(86400.0, 100))  # 100/day
-dm_cooldowns = lightbulb.CooldownManager(lambda ctx: lightbulb.UserBucket(86400.0, 20))  # 20/day
-sauce_cache = cachetools.TTLCache(maxsize=1024, ttl=3600)
+user_cooldowns = SharedCooldownManager("user", 300.0, 6, lambda ctx: ctx.author.id)  # 6/5 minutes
+dm_cooldowns = SharedCooldownManager("dm", 86400.0, 20, lambda ctx: ctx.author.id)  # 20/day
+
+_cache_config = config.get("cache", {})
+sauce_cache = TieredCache(
+    "sauce",
+    maxsize=int(_cache_config.get("size", 1024)),
+    ttl=int(_cache_config.get("ttl", 86400)),
+    serializer=serialize_results,
+    deserializer=deserialize_results,
+    persistent=bool(_cache_config.get("persistent", True))
+)
+anilist_cache = TieredCache(
+    "anilist",
+    maxsize=int(_cache_config.get("anilist_size", 2048)),
+    ttl=int(_cache_config.get("anilist_ttl", 604800)),
+    serializer=serialize_record,
+    deserializer=deserialize_record,
+    persistent=bool(_cache_config.get("persistent", True))
+)
+sauce_lookups = SingleFlight("SauceNao")
+anilist_lookups = SingleFlight("AniList")
+
+# Searching every image in a message looks up at most this many images, this many at a time
+SEARCH_ALL_MAX = int(config["saucenao"].get("search_all_max", 10))
+SEARCH_ALL_CONCURRENCY = int(config["saucenao"].get("search_all_concurrency", 3))
+
+# While someone picks which image to look up, the first few can be looked up in the background ahead of time
+SPECULATIVE_PREFETCH = int(config["saucenao"].get("speculative_prefetch", 0))
+SPECULATIVE_MIN_HEADROOM = float(config["saucenao"].get("speculative_min_headroom", 20))
+
+# Results can be re-ranked so close matches from the indexes we prefer come first, regardless of SauceNao's ordering
+RERANK = bool(config["saucenao"].get("rerank", False))
+PRIORITY = frozenset(int(index) for index in config["saucenao"].get("priority", [21, 22, 5, 37, 25]))
+PRIORITY_BONUS = float(config["saucenao"].get("priority_bonus", 5.0))
+
+# Images can be downloaded and shrunk before being uploaded to SauceNao, instead of having SauceNao fetch them itself
+UPLOAD = bool(config.get("upload", {}).get("enabled", False))
+
+# Resized and recompressed copies of images we've already found can be matched locally by their perceptual hash
+_near_duplicates_config = config.get("near_duplicates", {})
+near_duplicates = HashIndex(
+    _near_duplicates_config.get("path", "near_duplicates-{worker}.idx").format(worker=cluster.worker_id),
+    max_distance=int(_near_duplicates_config.get("max_distance", 6))
+) if _near_duplicates_config.get("enabled", False) else None
+
+# Every match above the minimum similarity from a search, best first
+Results = t.List[pysaucenao.GenericSource]
+
+
+class RenderedResult(t.NamedTuple):
+    """
+    A fully built response to a lookup, ready to be sent as is
+    """
+    embed: hikari.Embed
+    components: t.Sequence[hikari.api.MessageActionRowBuilder] = ()
+    links: t.Sequence[t.Tuple[str, str]] = ()
+
+
+class Lookup(t.NamedTuple):
+    """
+    The outcome of a lookup and the response for its best match, along with every match that was found
+    """
+    outcome: str
+    rendered: RenderedResult
+    key: t.Optional[str] = None
+    results: t.Sequence[pysaucenao.GenericSource] = ()
+
+
+# Responses to found results by sauce cache key, language and result index, so repeat lookups skip AniList and
+# rebuilding the embed
+rendered_cache = cachetools.TTLCache(
+    maxsize=int(_cache_config.get("rendered_size", 1024)),
+    ttl=int(_cache_config.get("ttl", 86400))
+)  # type: t.MutableMapping[t.Tuple[str, str, int], RenderedResult]
 
 
 @sauce_plugin.command()
-@lightbulb.add_cooldown(300.0, 1, lightbulb.UserBucket)
-@lightbulb.add_cooldown(86400.0, 100, lightbulb.GuildBucket)
 @lightbulb.command("sauce", "Look up the source of an image using a specified URL or file upload", ephemeral=True)
 @lightbulb.implements(lightbulb.SlashCommandGroup)
 async def sauce():
@@ -46,10 +123,16 @@ async def message_sauce(ctx: lightbulb.MessageContext):
         await ctx.respond(embeds.error(lang('Sauce', 'no_images')))
         return
 
-    image_url = await _multiple_images_prompt(ctx, image_attachments)
-    if not image_url:  # Prompt timeouts will result in this being None
+    selected = await _multiple_images_prompt(ctx, image_attachments)
+    if not selected:  # Prompt timeouts will result in this being None
+        return
+
+    if len(selected) > 1:
+        await _run_search_all(ctx, selected)
         return
 
+    image_url = _get_attachment_image(selected[0])
+    log.debug("Attachment selected: %s", ctx.get_guild(), image_url)
     await _run_sauce_command(ctx, image_url)
 
 
@@ -76,14 +159,19 @@ async def sauce_file(ctx: lightbulb.SlashContext):
 
 async def _command_init(ctx: lightbulb.Context):
     """
-    Sends a defer response and checks for any active cooldowns
+    Sends a defer response, checks for any active cooldowns and selects the guild's language
     """
     flags = hikari.MessageFlag.EPHEMERAL if ctx.get_guild() else hikari.MessageFlag.NONE
-    await ctx.respond(hikari.ResponseType.DEFERRED_MESSAGE_CREATE, flags=flags)
+    with metrics.stage_seconds.time(stage='defer'):
+        await ctx.respond(hikari.ResponseType.DEFERRED_MESSAGE_CREATE, flags=flags)
     await user_cooldowns.add_cooldown(ctx)
-    if ctx.get_guild():
-        await guild_cooldowns.add_cooldown(ctx)
-    else:
+
+    # Respond in the guild's language from here on out
+    if ctx.guild_id:
+        set_language((await Servers.get_settings(ctx.guild_id)).language)
+
+    # Guild usage of the public API keys is limited by their fair share of the daily quota instead (see quota.py)
+    if not ctx.get_guild():
         await dm_cooldowns.add_cooldown(ctx)
 
 
@@ -93,23 +181,52 @@ async def _run_sauce_command(ctx: lightbulb.Context, image_url: str):
     """
     log.info(f"Looking up image source/sauce: {image_url}", ctx.get_guild())
 
+    outcome = 'error'
+    try:
+        with metrics.stage_seconds.time(stage='total'):
+            outcome = await _lookup_and_respond(ctx, image_url)
+    finally:
+        metrics.lookups.inc(command=ctx.command.name, outcome=outcome)
+
+
+async def _lookup_and_respond(ctx: lightbulb.Context, image_url: str) -> str:
+    """
+    Looks up the image and responds with the result, returning the outcome of the lookup for our metrics
+    """
+    lookup = await _lookup(ctx, image_url, _get_sauce(ctx, image_url))
+
+    # Let the user page through the other matches too, unless we can't keep track of a view (see restbot.py)
+    if len(lookup.results) > 1 and not isinstance(ctx, InteractionContext):
+        await _respond_with_pages(ctx, image_url, lookup)
+        return lookup.outcome
+
+    # Errors are only shown to the person that ran the command, but anyone can see what we found
+    flags = hikari.MessageFlag.NONE if lookup.outcome == 'found' else hikari.UNDEFINED
+    await _respond(ctx, embed=lookup.rendered.embed, components=lookup.rendered.components, flags=flags)
+    return lookup.outcome
+
+
+async def _lookup(ctx: lightbulb.Context, image_url: str, lookup: t.Awaitable[t.Tuple[str, Results]]) -> Lookup:
+    """
+    Waits on the supplied lookup and builds the response for its best match
+    """
     # Attempt to find the source of this image
     try:
-        sauce_result = await _get_sauce(ctx, image_url)
-    except (pysaucenao.ShortLimitReachedException, pysaucenao.DailyLimitReachedException):
-        return await ctx.respond(embeds.error(lang('Sauce', 'api_limit_exceeded')))
+        key, results = await lookup
+    except (pysaucenao.ShortLimitReachedException, pysaucenao.DailyLimitReachedException) as e:
+        return Lookup(type(e).__name__, RenderedResult(embeds.error(lang('Sauce', 'api_limit_exceeded'))))
 
-    except pysaucenao.InvalidOrWrongApiKeyException:
+    except pysaucenao.InvalidOrWrongApiKeyException as e:
         log.warning(f"API key was rejected by SauceNao", ctx.get_guild())
-        return await ctx.respond(embeds.error(lang('Sauce', 'rejected_api_key')))
+        return Lookup(type(e).__name__, RenderedResult(embeds.error(lang('Sauce', 'rejected_api_key'))))
 
-    except pysaucenao.InvalidImageException:
+    except pysaucenao.InvalidImageException as e:
         log.debug(f"An invalid image / image link was provided", ctx.get_guild())
-        return await ctx.respond(embeds.error(lang('Sauce', 'no_images')))
+        return Lookup(type(e).__name__, RenderedResult(embeds.error(lang('Sauce', 'no_images'))))
 
-    except pysaucenao.SauceNaoException:
+    except pysaucenao.SauceNaoException as e:
         log.exception(f"An unknown error occurred while looking up this image", ctx.get_guild())
-        return await ctx.respond(embeds.error(lang('Sauce', 'api_offline')))
+        return Lookup(type(e).__name__, RenderedResult(embeds.error(lang('Sauce', 'api_offline'))))
 
     # If it's an anime, see if we can find a preview clip
     # TODO: Consider re-implementing support for video previews in the future
@@ -125,35 +242,165 @@ async def _run_sauce_command(ctx: lightbulb.Context, image_url: str):
     #             )
 
     # We didn't find anything, provide some suggestions for manual investigation
-    if not sauce_result:
+    if not results:
         log.debug(f"No image sources found", ctx.get_guild())
         embed = embeds.error(lang('Sauce', 'not_found_advice'))
         embed.title = lang('Sauce', 'not_found', member=ctx.author)
 
         view = SauceResultsView(image_url)
-        view.build_links(sauce_result)
+        view.build_links(None)
+        return Lookup('not_found', RenderedResult(embed, view.build(), result_links(image_url, None)), key, results)
+
+    return Lookup('found', await _render_match(ctx, image_url, key, results, 0), key, results)
+
+
+async def _render_match(ctx: lightbulb.Context, image_url: str, key: str,
+                        results: t.Sequence[pysaucenao.GenericSource], index: int) -> RenderedResult:
+    """
+    Builds the response for one of the matches for an image
+    """
+    # Repeat results are sent exactly as they were built the first time around
+    rendered_key = (key, current_language(), index)
+    rendered = rendered_cache.get(rendered_key)
+    if not rendered:
+        rendered = await _render_result(ctx, image_url, results[index])
+        rendered_cache[rendered_key] = rendered
+
+    return rendered
 
-        await ctx.respond(embed=embed, components=view)
-        return
 
+async def _respond_with_pages(ctx: lightbulb.Context, image_url: str, lookup: Lookup) -> None:
+    """
+    Responds with the best match straight away, then builds the pages for the rest of the matches in the background
+    """
+    loading = (embeds.default(message=lang('Sauce', 'loading_match')), ())
+    view = SauceGalleryView([(lookup.rendered.embed, lookup.rendered.links)] + [loading] * (len(lookup.results) - 1))
+    view.response = await _respond(ctx, embed=view.embed, components=view, flags=hikari.MessageFlag.NONE)
+    await view.start(view.response)
+
+    async def fill_page(index: int):
+        try:
+            rendered = await _render_match(ctx, image_url, lookup.key, lookup.results, index)
+        except Exception:
+            log.exception(f"Failed to build the page for match {index + 1}", ctx.get_guild())
+            rendered = RenderedResult(embeds.error(lang('Sauce', 'api_offline')))
+
+        try:
+            await view.set_page(index, (rendered.embed, rendered.links))
+        except hikari.HikariError as e:
+            log.debug("Unable to update search results: %s", ctx.get_guild(), e)
+
+    await asyncio.gather(*(fill_page(index) for index in range(1, len(lookup.results))))
+
+
+async def _render_result(ctx: lightbulb.Context, image_url: str,
+                         sauce_result: pysaucenao.GenericSource) -> RenderedResult:
+    """
+    Builds the embed and link buttons for a found result
+    """
     if isinstance(sauce_result, pysaucenao.AnimeSource):
-        await sauce_result.load_ids()
+        with metrics.stage_seconds.time(stage='load_ids'):
+            await sauce_result.load_ids()
 
     view = SauceResultsView(image_url)
     view.build_links(sauce_result)
 
-    await ctx.respond(
-        embed=(await _build_sauce_embed(ctx, sauce_result)),
-        components=view,
-        flags=hikari.MessageFlag.NONE
-    )
+    with metrics.stage_seconds.time(stage='build_embed'):
+        embed = await _build_sauce_embed(ctx, sauce_result)
+
+    # The view only holds link buttons, so it never needs to be started and its components can be reused as they are
+    return RenderedResult(embed, view.build(), result_links(image_url, sauce_result))
 
 
-async def _multiple_images_prompt(ctx: lightbulb.MessageContext, image_attachments: t.List[hikari.Attachment]):
+async def _respond(ctx: lightbulb.Context, *args, **kwargs) -> t.Any:
     """
-    When there's multiple images available, prompt the user to pick one
+    Sends the final response to a lookup
     """
-    if len(image_attachments) > 1:
+    with metrics.stage_seconds.time(stage='respond'):
+        return await ctx.respond(*args, **kwargs)
+
+
+async def _run_search_all(ctx: lightbulb.MessageContext,
+                          attachments: t.List[t.Union[hikari.Attachment, hikari.Embed]]) -> None:
+    """
+    Looks up every image in a message at once, showing the results in a single paginated response
+
+    Images we already have results for are shown straight away, while the rest are looked up a few at a time and
+    filled in as they finish. Only as many searches as the guild has quota for are started, and each search past the
+    first counts towards the users cooldown.
+    """
+    image_urls = [image_url for image_url in map(_get_attachment_image, attachments) if image_url][:SEARCH_ALL_MAX]
+    if not image_urls:
+        await _respond(ctx, embed=embeds.error(lang('Sauce', 'no_images')))
+        return
+
+    log.info(f"Looking up the sources of {len(image_urls)} images", ctx.get_guild())
+
+    cached = await asyncio.gather(*(_get_cached_sauce(ctx, image_url) for image_url in image_urls))
+    searching = RenderedResult(embeds.default(message=lang('Sauce', 'searching')))
+    pages = [searching] * len(image_urls)
+    for index, (image_url, (key, results)) in enumerate(zip(image_urls, cached)):
+        if results is not MISSING:
+            pages[index] = await _search_all_page(ctx, image_url, _found(key, results))
+
+    # Start on the first result we already have, if there is one
+    first = next((index for index, page in enumerate(pages) if page is not searching), 0)
+    view = SauceGalleryView([(page.embed, page.links) for page in pages], first)
+    view.response = await _respond(ctx, embed=view.embed, components=view, flags=hikari.MessageFlag.NONE)
+    await view.start(view.response)
+
+    uncached = [index for index, (_, results) in enumerate(cached) if results is MISSING]
+    if not uncached:
+        return
+
+    pool = await _key_pool(ctx)
+    budget = max(int(min(pool.available(requester_id(ctx.guild_id, ctx.author.id)), len(uncached))), 1)
+    semaphore = asyncio.Semaphore(SEARCH_ALL_CONCURRENCY)
+
+    async def search(key: str, image_url: str, charge: bool):
+        async with semaphore:
+            if charge:
+                await user_cooldowns.add_cooldown(ctx)
+            return await _search_sauce(ctx, key, image_url, pool)
+
+    async def fill_page(index: int, search_number: int):
+        image_url, (key, _) = image_urls[index], cached[index]
+        if search_number >= budget:
+            page = RenderedResult(embeds.error(lang('Sauce', 'api_limit_exceeded')))
+        else:
+            # The first search is covered by running the command
+            page = await _search_all_page(ctx, image_url, search(key, image_url, search_number > 0))
+
+        try:
+            await view.set_page(index, (page.embed, page.links))
+        except hikari.HikariError as e:
+            log.debug("Unable to update search results: %s", ctx.get_guild(), e)
+
+    await asyncio.gather(*(fill_page(index, number) for number, index in enumerate(uncached)))
+
+
+async def _search_all_page(ctx: lightbulb.Context, image_url: str,
+                           lookup: t.Awaitable[t.Tuple[str, Results]]) -> RenderedResult:
+    try:
+        outcome, rendered, _, _ = await _lookup(ctx, image_url, lookup)
+    except lightbulb.errors.CommandIsOnCooldown:
+        outcome, rendered = 'cooldown', RenderedResult(embeds.error(lang('Sauce', 'member_api_limit_exceeded')))
+
+    metrics.lookups.inc(command='search_all', outcome=outcome)
+    return rendered
+
+
+async def _found(key: str, results: Results) -> t.Tuple[str, Results]:
+    return key, results
+
+
+async def _multiple_images_prompt(ctx: lightbulb.MessageContext, image_attachments: t.List[hikari.Attachment]
+                                  ) -> t.Optional[t.List[t.Union[hikari.Attachment, hikari.Embed]]]:
+    """
+    When there's multiple images available, prompt the user to pick one, or to search all of them
+    """
+    # Over HTTP, the selection could be routed to a different replica than the one waiting on it, so we don't ask
+    if len(image_attachments) > 1 and not isinstance(ctx, InteractionContext):
         view = SelectTemplateView(image_attachments)
         view.build_select()
         embed = embeds.default(
@@ -161,19 +408,92 @@ async def _multiple_images_prompt(ctx: lightbulb.MessageContext, image_attachmen
         )
         response = await ctx.respond(embed=embed, components=view)
         await view.start(response)
-        await view.wait_for_input(60)
+
+        speculation = await _speculate(ctx, image_attachments)
+        try:
+            await view.wait_for_input(60)
+        finally:
+            if view.search_all:
+                chosen = range(len(image_attachments))
+            else:
+                chosen = [image_attachments.index(view.selected)] if view.selected else []
+            _settle_speculation(speculation, chosen)
+
         view.select.disabled = True
         await response.edit(components=view)
         if not view.selected:
             return log.debug(f"No image selected, canceling", ctx.get_guild())
 
-        attachment = view.selected
-    else:
-        attachment = image_attachments[0]
+        return image_attachments if view.search_all else [view.selected]
+
+    return image_attachments[:1]
+
 
-    image_url = _get_attachment_image(attachment)
-    log.debug(f"Attachment selected: {image_url}", ctx.get_guild())
-    return image_url
+async def _speculate(ctx: lightbulb.Context, attachments: t.List[t.Union[hikari.Attachment, hikari.Embed]]
+                     ) -> t.Dict[int, asyncio.Task]:
+    """
+    Starts looking up the first few images in the background, if there's enough quota to spare
+
+    Whichever image ends up being picked joins its in-flight lookup (or finds it cached), rather than starting over
+    """
+    if not SPECULATIVE_PREFETCH:
+        return {}
+
+    pool = await _key_pool(ctx)
+    guild_id = requester_id(ctx.guild_id, ctx.author.id)
+    if pool.available(guild_id) < SPECULATIVE_MIN_HEADROOM:
+        metrics.speculative_lookups.inc(result='skipped')
+        return {}
+
+    tasks = {}
+    for index, attachment in enumerate(attachments[:SPECULATIVE_PREFETCH]):
+        image_url = _get_attachment_image(attachment)
+        if image_url:
+            tasks[index] = asyncio.create_task(_prefetch(image_url, pool, guild_id))
+            tasks[index].add_done_callback(_prefetch_done)
+
+    log.debug("Speculatively looking up %d images", guild_id, len(tasks))
+    return tasks
+
+
+async def _prefetch(url: str, pool: KeyPool, guild_id: int) -> bool:
+    """
+    Warms the sauce cache for an image, returning whether it needed a search to do so
+    """
+    key = await cache_key(url)
+    if await sauce_cache.get(key) is not MISSING:
+        return False
+
+    await sauce_lookups.run(key, lambda: _search(key, url, pool, guild_id, None))
+    return True
+
+
+def _prefetch_done(task: asyncio.Task) -> None:
+    # Failures are left for the real lookup to run into and report, if the image gets picked
+    if not task.cancelled() and task.exception():
+        log.debug("Speculative lookup failed: %s", None, task.exception())
+
+
+def _settle_speculation(tasks: t.Dict[int, asyncio.Task], chosen: t.Collection[int]) -> None:
+    """
+    Cancels the speculative lookups for images that weren't picked, and records whether they paid off
+    """
+    for index, task in tasks.items():
+        if task.cancelled():
+            result = 'cancelled'
+        elif task.done() and task.exception():
+            result = 'failed'
+        elif task.done() and not task.result():
+            result = 'cached'  # Nothing was gained or lost
+        elif index in chosen:
+            result = 'hit' if task.done() else 'joined'
+        elif task.done():
+            result = 'wasted'
+        else:
+            task.cancel()
+            result = 'cancelled'
+
+        metrics.speculative_lookups.inc(result=result)
 
 
 def _get_image_attachments(message: hikari.Message) -> t.Optional[t.List[t.Union[hikari.Attachment, hikari.Embed]]]:
@@ -191,7 +511,7 @@ def _get_image_attachments(message: hikari.Message) -> t.Optional[t.List[t.Union
             if embed.url:
                 image_attachments.append(embed)
 
-    log.debug(f"Found {len(image_attachments)} image(s) in message {message.id}", message.guild_id)
+    log.debug("Found %d image(s) in message %s", message.guild_id, len(image_attachments), message.id)
     return image_attachments
 
 
@@ -220,32 +540,161 @@ def _get_attachment_image(attachment: t.Union[hikari.Attachment, hikari.Embed])
             return attachment.thumbnail.url
 
 
-async def _get_sauce(ctx: lightbulb.Context, url: str) -> t.Optional[pysaucenao.GenericSource]:
+async def _get_sauce(ctx: lightbulb.Context, url: str) -> t.Tuple[str, Results]:
     """
-    Perform a SauceNao lookup on the supplied URL
+    Perform a SauceNao lookup on the supplied URL, returning its cache key along with the results
+    """
+    key, cached = await _get_cached_sauce(ctx, url)
+    if cached is not MISSING:
+        return key, cached
+
+    return key, await _search_sauce(ctx, key, url, await _key_pool(ctx), lambda position: _queue_notice(ctx, position))
+
+
+async def _get_cached_sauce(ctx: lightbulb.Context, url: str) -> t.Tuple[str, t.Any]:
+    """
+    Gets the cache key for the supplied URL and the cached results for it, or MISSING if we don't have any
     """
     # Increment the query counter for this guild
-    await Servers.log_query(ctx.get_guild() or 0)  # "0" indicates DM queries
+    with metrics.stage_seconds.time(stage='log_query'):
+        Servers.log_query(ctx.get_guild())  # DM queries are logged under a guild ID of "0"
 
     # Check and see if we have this result cached first
-    url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()
-    if url_hash in sauce_cache:
-        log.debug(f"Cache hit: {url}", ctx.get_guild())
-        return sauce_cache[url_hash]
+    with metrics.stage_seconds.time(stage='cache_key'):
+        key = await cache_key(url)
+    with metrics.stage_seconds.time(stage='cache_get'):
+        cached = await sauce_cache.get(key)
+    if cached is not MISSING:
+        log.debug("Cache hit: %s (%s)", ctx.get_guild(), url, key)
+        metrics.cache_lookups.inc(key_type=key_type(key), result='hit')
+        return key, cached
+
+    metrics.cache_lookups.inc(key_type=key_type(key), result='miss')
+    return key, MISSING
+
 
-    # Get the API key for this server, or fallback to the default public key
-    api_key = await Servers.get_api_key(ctx.get_guild()) if ctx.get_guild() else None
-    api_key = api_key or config["saucenao"]["token"]
+async def _key_pool(ctx: lightbulb.Context) -> KeyPool:
+    """
+    Use this server's own API key if it has one, otherwise fall back to the shared pool of public keys
+    """
+    with metrics.stage_seconds.time(stage='api_key'):
+        api_key = await Servers.get_api_key(ctx.get_guild()) if ctx.get_guild() else None
+
+    return guild_pool(api_key) if api_key else public_pool
 
-    # Initialize SauceNao and execute a search query
-    saucenao = SauceNao(api_key=api_key,
-                        min_similarity=float(config["saucenao"]["min_similarity"]),
-                        priority=[21, 22, 5, 37, 25])
-    search = await saucenao.from_url(url)
-    _sauce = search.results[0] if search.results else None
 
-    sauce_cache[url_hash] = _sauce
-    return _sauce
+async def _search_sauce(ctx: lightbulb.Context, key: str, url: str, pool: KeyPool,
+                        on_position: t.Optional[t.Callable[[int], t.Awaitable]] = None) -> Results:
+    """
+    Searches SauceNao for an image we don't have a cached result for
+    """
+    # If someone else is already looking this image up, wait on their result instead of sending another query
+    guild_id = requester_id(ctx.guild_id, ctx.author.id)
+    return await sauce_lookups.run(key, lambda: _search(key, url, pool, guild_id, on_position))
+
+
+async def _search(key: str, url: str, pool: KeyPool, guild_id: int,
+                  on_position: t.Optional[t.Callable[[int], t.Awaitable]]) -> Results:
+    """
+    Query SauceNao for the supplied URL and cache the results
+    """
+    if not (UPLOAD or near_duplicates):
+        # Execute a search query using the key in the pool with the most quota left, waiting in line if there is none
+        with metrics.stage_seconds.time(stage='saucenao'):
+            search = await pool.run(lambda api_key: clients.saucenao(api_key).from_url(url), guild_id,
+                                    on_position=on_position)
+
+        return _cache_results((key,), _rank(search.results))
+
+    # Looking at the image ourselves means anything that isn't one is refused before it can use up any quota
+    prepared = await images.prepare(url, shrink=UPLOAD)
+    known = await _known_image(key, prepared)
+    if known is not MISSING:
+        return _cache_results((key,), known)
+
+    with metrics.stage_seconds.time(stage='saucenao'):
+        if UPLOAD:
+            search = await pool.run(lambda api_key: clients.saucenao(api_key).from_file(prepared.data), guild_id,
+                                    on_position=on_position)
+        else:
+            search = await pool.run(lambda api_key: clients.saucenao(api_key).from_url(url), guild_id,
+                                    on_position=on_position)
+
+    # Results are also cached by the image's content, so the same image shared again under a different attachment or
+    # link doesn't need another search
+    results = _cache_results({key, content_key(prepared.original)}, _rank(search.results))
+    if results and near_duplicates:
+        near_duplicates.add(prepared.hash, key)
+
+    return results
+
+
+async def _known_image(key: str, prepared: images.PreparedImage) -> t.Any:
+    """
+    Gets the cached results for the exact same image under another key, or failing that, for a near duplicate of it
+
+    Returns MISSING if we haven't seen anything like the image before
+    """
+    content = content_key(prepared.original)
+    if content != key:
+        cached = await sauce_cache.get(content)
+        if cached is not MISSING:
+            metrics.cache_lookups.inc(key_type='content', result='hit')
+            return cached
+
+    if not near_duplicates:
+        return MISSING
+
+    with metrics.stage_seconds.time(stage='near_duplicates'):
+        matches = near_duplicates.search(prepared.hash)
+
+    # Entries outlive the results they point to, which may have expired from the cache since
+    for distance, match in matches:
+        cached = await sauce_cache.get(match)
+        if cached is not MISSING and cached:
+            log.debug("Near duplicate of %s found %d bits away", None, match, distance)
+            metrics.cache_lookups.inc(key_type='near_duplicate', result='hit')
+            return cached
+
+    metrics.cache_lookups.inc(key_type='near_duplicate', result='miss')
+    return MISSING
+
+
+def _cache_results(keys: t.Iterable[str], results: Results) -> Results:
+    """
+    Caches every match for an image under each of its keys, including anime matches that never get rendered and so
+    never have their IDs loaded
+    """
+    # Don't hold on to empty results for as long, in case the image gets indexed later on
+    ttl = None if results else int(_cache_config.get("negative_ttl", 3600))
+    for key in keys:
+        sauce_cache.set(key, results, ttl)
+
+    return results
+
+
+def _rank(results: t.Iterable[pysaucenao.GenericSource]) -> Results:
+    """
+    Orders results by similarity, giving matches from the indexes we prefer a head start when re-ranking is enabled
+    """
+    if not RERANK:
+        return list(results)
+
+    # Sorting is stable, so SauceNao's own ordering breaks any ties
+    return sorted(results, key=lambda r: r.similarity + (PRIORITY_BONUS if r.index_id in PRIORITY else 0),
+                  reverse=True)
+
+
+async def _queue_notice(ctx: lightbulb.Context, position: int) -> None:
+    """
+    Let the user know their lookup is waiting in line for API quota
+    """
+    try:
+        await ctx.interaction.edit_initial_response(embed=embeds.default(
+            message=lang('Sauce', 'queued', {'position': position})
+        ))
+    except hikari.HikariError as e:
+        log.debug("Unable to update queue position: %s", ctx.get_guild(), e)
 
 
 async def _build_sauce_embed(ctx: lightbulb.Context, sauce_result: pysaucenao.GenericSource) -> hikari.Embed:
@@ -290,49 +739,100 @@ async def _build_anime_embed(sauce_result: pysaucenao.AnimeSource, embed: hikari
     if sauce_result.anilist_url:
         embed.url = sauce_result.anilist_url
 
-    async with anilist.AsyncClient() as anilist_client:
-        anilist_sauce = await anilist_client.get(sauce_result.anilist_id)
+    # The ID mapping service doesn't know of every anime, or may be down, and then there's nothing to pull
+    anilist_id = sauce_result.anilist_id
+    if not anilist_id:
+        return embed
 
-    embed.set_image(anilist_sauce.cover.extra_large)
+    anilist_sauce = await anilist_cache.get(str(anilist_id))
+    if anilist_sauce is MISSING:
+        anilist_sauce = await anilist_lookups.run(anilist_id, lambda: _get_anilist(anilist_id))
 
-    description = str(anilist_sauce.description).replace("<br>", "\n")  # Replace breaks with newlines
-    description = description.replace("<br/>", "\n")
-    description = re.sub('<[^<]+?>', '', description)  # Strip HTML tags
-    description = re.sub(r'\n{3,}', "\n\n", description)  # Reduce excessive newlines
-    description = truncate(escape_markdown(description), 4096)
-    embed.description = description
+    embed.set_image(anilist_sauce.cover_url)
+    embed.description = anilist_sauce.description
 
     if anilist_sauce.genres:
         embed.add_field(name=lang('Sauce', 'genres'), value=codewrap(', '.join(anilist_sauce.genres)), inline=False)
 
-    if anilist_sauce.start_date:
-        start_date = date(anilist_sauce.start_date.year, anilist_sauce.start_date.month, anilist_sauce.start_date.day)
-
-        # Get the approximate season
-        yday = start_date.timetuple().tm_yday
-        spring = range(80, 172)
-        summer = range(172, 264)
-        fall = range(264, 355)
-
-        if yday in spring:
-            season = lang('Sauce', 'season_spring')
-        elif yday in summer:
-            season = lang('Sauce', 'season_summer')
-        elif yday in fall:
-            season = lang('Sauce', 'season_fall')
-        else:
-            season = lang('Sauce', 'season_winter')
-
-        embed.add_field(name=lang('Sauce', 'aired'), value=codewrap(f"{season} {anilist_sauce.start_date.year}"), inline=False)
+    if anilist_sauce.season:
+        season = lang('Sauce', f'season_{anilist_sauce.season}')
+        embed.add_field(name=lang('Sauce', 'aired'), value=codewrap(f"{season} {anilist_sauce.year}"), inline=False)
 
-    if anilist_sauce.rankings:
-        embed.add_field(name=lang('Sauce', 'rankings'), value=codewrap(anilist_sauce.rankings[0].rank), inline=True)
+    if anilist_sauce.rank:
+        embed.add_field(name=lang('Sauce', 'rankings'), value=codewrap(anilist_sauce.rank), inline=True)
     if anilist_sauce.score:
-        embed.add_field(name=lang('Sauce', 'rating'), value=codewrap(f"{anilist_sauce.score.average}%"), inline=True)
+        embed.add_field(name=lang('Sauce', 'rating'), value=codewrap(f"{anilist_sauce.score}%"), inline=True)
 
     return embed
 
 
+async def _get_anilist(anilist_id: int) -> AniListRecord:
+    """
+    Fetch and process an anime from AniList, then cache the result
+    """
+    with metrics.stage_seconds.time(stage='anilist'):
+        media = await clients.anilist().get(anilist_id)
+
+    record = process_media(media)
+    anilist_cache.set(str(anilist_id), record)
+    return record
+
+
+async def warm_caches():
+    """
+    Warm up the sauce caches from the database
+    """
+    try:
+        await sauce_cache.warm(int(_cache_config.get("warm_entries", 1024)))
+        await anilist_cache.warm(int(_cache_config.get("warm_entries", 1024)))
+    except SQLAlchemyError:
+        log.exception("Failed to warm the sauce caches")
+
+    if near_duplicates:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, near_duplicates.open)
+            log.info(f"Loaded {len(near_duplicates)} entries into the near duplicate index")
+        except OSError:
+            log.exception("Failed to open the near duplicate index, near duplicates won't be looked for")
+
+
+async def write_caches():
+    """
+    Write new cache entries to the database in batches
+    """
+    await sauce_cache.flush()
+    await anilist_cache.flush()
+    if near_duplicates:
+        await asyncio.get_running_loop().run_in_executor(None, near_duplicates.flush)
+
+
+@sauce_plugin.listener(hikari.StartingEvent)
+async def on_starting(event: hikari.StartingEvent):
+    """
+    Warm up the sauce cache from the database before we start accepting commands
+    """
+    await warm_caches()
+
+
+@sauce_plugin.listener(hikari.StartedEvent)
+async def on_started(event: hikari.StartedEvent):
+    flush_caches.start()
+
+
+@sauce_plugin.listener(hikari.StoppingEvent)
+async def on_stopping(event: hikari.StoppingEvent):
+    """
+    Persist anything still waiting to be written before shutting down
+    """
+    flush_caches.cancel()
+    await write_caches()
+
+
+@tasks.task(s=30)
+async def flush_caches():
+    await write_caches()
+
+
 def load(_bot: lightbulb.BotApp):
     _bot.add_plugin(sauce_plugin)
 
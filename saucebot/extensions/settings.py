@@ -1,14 +1,22 @@
+import asyncio
+import typing as t
+
 import hikari
 import lightbulb
+from sqlalchemy.exc import SQLAlchemyError
 
-from saucebot.components import embeds
-from saucebot.lang.lang import lang
+from saucebot.components import embeds, log
+from saucebot.lang.lang import lang, languages, set_language
 from saucebot.models.servers import Servers
 
 settings = lightbulb.Plugin("Settings")
 settings.add_checks(lightbulb.has_guild_permissions(hikari.Permissions.ADMINISTRATOR))
 settings.add_checks(lightbulb.guild_only)
 
+# Guilds that have become available and are waiting to have their settings prefetched
+_prefetch_queue = set()  # type: t.Set[int]
+_prefetch_task = None  # type: t.Optional[asyncio.Task]
+
 
 @settings.command()
 @lightbulb.command("config", "Configure guild specific settings", ephemeral=True, auto_defer=True)
@@ -23,6 +31,7 @@ async def config(ctx: lightbulb.SlashContext):
 @lightbulb.command("api_key", "Provide a SauceNAO API key for this guild to increase search limits")
 @lightbulb.implements(lightbulb.SlashSubCommand)
 async def api_key(ctx: lightbulb.SlashContext):
+    set_language((await Servers.get_settings(ctx.guild_id)).language)
     try:
         await Servers.register(ctx.get_guild(), ctx.options.api_key)
     except ValueError as e:
@@ -31,6 +40,47 @@ async def api_key(ctx: lightbulb.SlashContext):
     await ctx.respond(embed=embeds.success(message=lang('Sauce', 'registered_api_key')))
 
 
+@config.child()
+@settings.command()
+@lightbulb.option("language", "The language to respond in", str, choices=sorted(languages))
+@lightbulb.command("language", "Change the language the bot responds in on this guild")
+@lightbulb.implements(lightbulb.SlashSubCommand)
+async def language(ctx: lightbulb.SlashContext):
+    try:
+        await Servers.set_language(ctx.get_guild(), ctx.options.language)
+    except ValueError as e:
+        return await ctx.respond(embed=embeds.error(str(e)))
+
+    set_language(ctx.options.language)
+    await ctx.respond(embed=embeds.success(message=lang('Settings', 'language_set')))
+
+
+@settings.listener(hikari.GuildAvailableEvent)
+async def on_guild_available(event: hikari.GuildAvailableEvent):
+    """
+    Queue up guilds to have their settings prefetched
+
+    Guilds become available one at a time when shards connect, so they're collected for a moment and then loaded
+    in bulk rather than querying for each guild individually
+    """
+    global _prefetch_task
+
+    _prefetch_queue.add(event.guild_id)
+    if not _prefetch_task or _prefetch_task.done():
+        _prefetch_task = asyncio.create_task(_prefetch_settings())
+
+
+async def _prefetch_settings():
+    await asyncio.sleep(1.0)
+
+    guild_ids = list(_prefetch_queue)
+    _prefetch_queue.clear()
+    try:
+        await Servers.prefetch_settings(guild_ids)
+    except SQLAlchemyError:
+        log.exception(f"Failed to prefetch settings for {len(guild_ids)} guilds")
+
+
 # Extension methods
 def load(_bot: lightbulb.BotApp):
     _bot.add_plugin(settings)
@@ -1,8 +1,10 @@
-import os
+import contextvars
 import pathlib
 import random
+import re
 import typing as t
 from configparser import ConfigParser
+from types import MappingProxyType
 
 import hikari
 
@@ -10,67 +12,125 @@ from saucebot.components import log
 from saucebot.components.config import config
 from saucebot.components.helpers import escape_markdown
 
-__all__ = ['lang', 'rand_lang']
+__all__ = ['lang', 'rand_lang', 'languages', 'default_language', 'current_language', 'set_language', 'Template']
 
 
-# Set up localization for use elsewhere in the application
-language = config["bot"]["language"]
-language_config = ConfigParser()
-language_config.read(os.path.join(pathlib.Path(__file__).parent.resolve(), f'{language}.ini'), 'utf-8')
+_placeholder_re = re.compile(r"\{(\w+)\}")
+
+
+class Template:
+    """
+    A language string that has been split up around its {placeholders} ahead of time
+
+    Rendering only has to fill in the placeholder slots and join the parts back together, rather than scanning the
+    whole string once for every replacement
+    """
+    __slots__ = ('text', '_parts')
+
+    def __init__(self, text: str):
+        self.text = text
+        # Even indexes hold literal text and odd indexes hold placeholder names
+        self._parts = tuple(_placeholder_re.split(text))
+
+    def render(self, replacements: t.Optional[t.Mapping[str, t.Any]] = None) -> str:
+        if len(self._parts) == 1 or not replacements:
+            return self.text
+
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            # Placeholders without a replacement are left as they are
+            parts[i] = str(replacements[name]) if name in replacements else f"{{{name}}}"
+
+        return ''.join(parts)
+
+
+def _compile(path: pathlib.Path) -> t.Mapping[str, t.Mapping[str, Template]]:
+    """
+    Parses a language file into templates, grouped by category
+    """
+    parser = ConfigParser()
+    parser.read(path, 'utf-8')
+
+    return MappingProxyType({
+        category: MappingProxyType({key: Template(parser.get(category, key)) for key in parser.options(category)})
+        for category in parser.sections()
+    })
+
+
+# Every language file is compiled once on startup, and guilds can pick whichever one they like
+languages = MappingProxyType({
+    path.stem: _compile(path) for path in sorted(pathlib.Path(__file__).parent.resolve().glob('*.ini'))
+})  # type: t.Mapping[str, t.Mapping[str, t.Mapping[str, Template]]]
+default_language = config["bot"]["language"]
+
+# The language used by lang() when one isn't passed in explicitly, set from the guild's settings for each command
+_current_language = contextvars.ContextVar('language', default=default_language)
+
+
+def current_language() -> str:
+    return _current_language.get()
+
+
+def set_language(language: t.Optional[str]) -> None:
+    """
+    Sets the language used for the rest of the current command
+    """
+    _current_language.set(language if language in languages else default_language)
 
 
 def lang(category: str, key: str, replacements: t.Optional[dict] = None, default=None,
-         member: t.Optional[t.Union[hikari.Member, hikari.User]] = None):
+         member: t.Optional[t.Union[hikari.Member, hikari.User]] = None, language: t.Optional[str] = None):
     """
     Provides easy to use application localization in the form of ini configuration files
 
-    Language strings can be added or altered in the lang/{language}.ini file
+    Language strings can be added or altered in the lang/{language}.ini file. Strings missing from the guild's
+    language fall back to the default language.
     """
-    string = language_config.get(category, key, fallback=default)  # type: str
-    if string:
-        if replacements:
-            for rkey, rvalue in replacements.items():
-                string = string.replace(f"{{{rkey}}}", str(rvalue))
-
-        if member:
-            string = member_replacements(string, member)
+    language = language or _current_language.get()
+    template = _get_template(language, category, key) or _get_template(default_language, category, key)
+    if not template:
+        if default:
+            template = Template(default)
+        else:
+            log.warning(f"Missing {language} language string: {key} ({category})")
+            return '<Missing language string>'
 
-    else:
-        log.warning(f"Missing {language} language string: {key} ({category})")
-        return '<Missing language string>'
+    if member:
+        replacements = {**(replacements or {}), **member_replacements(member)}
 
-    return string
+    return template.render(replacements)
 
 
 def rand_lang(category: str, replacements: t.Optional[dict] = None, default=None,
-              member: t.Optional[t.Union[hikari.Member, hikari.User]] = None, return_index: bool = False):
+              member: t.Optional[t.Union[hikari.Member, hikari.User]] = None, return_index: bool = False,
+              language: t.Optional[str] = None):
     """
     An alternative to the regular lang() method that pulls a random language string from the specified category
     """
-    strings = language_config.items(category)
-    if strings:
-        key, string = random.choice(strings)
+    language = language or _current_language.get()
+    templates = languages.get(language, {}).get(category) or languages[default_language].get(category)
+    if templates:
+        key = random.choice(list(templates))
+        template = templates[key]
     else:
         if default:
-            key, string = None, default
+            key, template = None, Template(default)
         else:
             log.warning(f"Missing {language} language category: {category}")
             return '<Missing language string>'
 
-    if replacements:
-        for rkey, rvalue in replacements.items():
-            string = string.replace(f"{{{rkey}}}", rvalue)
-
     if member:
-        string = member_replacements(string, member)
+        replacements = {**(replacements or {}), **member_replacements(member)}
 
+    string = template.render(replacements)
     if return_index:
         return string, key
 
     return string
 
 
-def member_replacements(string: str, member: t.Union[hikari.Member, hikari.User]) -> str:
+def member_replacements(member: t.Union[hikari.Member, hikari.User]) -> t.Dict[str, str]:
     """
     Perform some standard replacements for language strings
     """
@@ -80,9 +140,9 @@ def member_replacements(string: str, member: t.Union[hikari.Member, hikari.User]
         name = member.username
 
     # Escape any formatting tags from the users name
-    name = escape_markdown(name)
+    return {'display_name': escape_markdown(name), 'mention': member.mention}
 
-    string = string.replace('{display_name}', name)
-    string = string.replace('{mention}', member.mention)
 
-    return string
+def _get_template(language: str, category: str, key: str) -> t.Optional[Template]:
+    # ConfigParser lower cases option names when reading them
+    return languages.get(language, {}).get(category, {}).get(key.lower())
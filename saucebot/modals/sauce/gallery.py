@@ -0,0 +1,89 @@
+import asyncio
+import typing as t
+
+import hikari
+import miru
+
+__all__ = ['SauceGalleryView']
+
+
+# An embed, and the labels and URLs of the link buttons to show with it
+Page = t.Tuple[hikari.Embed, t.Sequence[t.Tuple[str, str]]]
+
+
+class SauceGalleryView(miru.View):
+    """
+    Pages through the results for every image in a message
+
+    Pages can be replaced while the view is running, so results can be shown as soon as each lookup finishes
+    """
+
+    def __init__(self, pages: t.List[Page], index: int = 0, timeout: float = 600.0):
+        self.pages = pages
+        self.index = index
+        self.response = None  # type: t.Optional[t.Any]
+        self._lock = asyncio.Lock()
+
+        super().__init__(timeout=timeout)
+
+        self.previous = miru.Button(label="◀", style=hikari.ButtonStyle.SECONDARY, row=0)
+        self.previous.callback = self.previous_callback
+        self.counter = miru.Button(style=hikari.ButtonStyle.SECONDARY, disabled=True, row=0)
+        self.next = miru.Button(label="▶", style=hikari.ButtonStyle.SECONDARY, row=0)
+        self.next.callback = self.next_callback
+        self.build_page()
+
+    @property
+    def embed(self) -> hikari.Embed:
+        return self.pages[self.index][0]
+
+    def build_page(self, navigation: bool = True) -> None:
+        """
+        Builds the navigation and link buttons for the current page
+        """
+        self.clear_items()
+        if navigation:
+            self.previous.disabled = self.index == 0
+            self.counter.label = f"{self.index + 1} / {len(self.pages)}"
+            self.next.disabled = self.index == len(self.pages) - 1
+            for button in (self.previous, self.counter, self.next):
+                self.add_item(button)
+
+        for label, url in self.pages[self.index][1]:
+            self.add_item(miru.Button(label=label, url=url, row=1))
+
+    async def set_page(self, index: int, page: Page) -> None:
+        """
+        Replaces a page, updating the message if it's the one being shown
+        """
+        self.pages[index] = page
+        if index != self.index or not self.response:
+            return
+
+        async with self._lock:
+            self.build_page()
+            await self.response.edit(embed=self.embed, components=self)
+
+    async def previous_callback(self, ctx: miru.ViewContext) -> None:
+        await self._show(ctx, self.index - 1)
+
+    async def next_callback(self, ctx: miru.ViewContext) -> None:
+        await self._show(ctx, self.index + 1)
+
+    async def on_timeout(self) -> None:
+        if not self.response:
+            return
+
+        # Leave whichever result was being shown up with its links, but without the buttons that no longer work
+        async with self._lock:
+            self.build_page(navigation=False)
+            try:
+                await self.response.edit(embed=self.embed, components=self)
+            except hikari.HikariError:
+                pass
+
+    async def _show(self, ctx: miru.ViewContext, index: int) -> None:
+        async with self._lock:
+            self.index = max(min(index, len(self.pages) - 1), 0)
+            self.build_page()
+            await ctx.edit_response(embed=self.embed, components=self)
@@ -6,7 +6,7 @@ import pysaucenao
 
 from saucebot.lang.lang import lang
 
-__all__ = ['SauceResultsView']
+__all__ = ['SauceResultsView', 'result_links']
 
 
 class SauceResultsView(miru.View):
@@ -19,34 +19,37 @@ class SauceResultsView(miru.View):
         super().__init__()
 
     def build_links(self, sauce: t.Optional[pysaucenao.GenericSource]):
-        if not sauce:
-            google_url = f"https://lens.google.com/uploadbyurl?url={quote_plus(self.image_url)}&safe=off"
-            ascii_url = f"https://ascii2d.net/search/url/{quote_plus(self.image_url)}"
-            yandex_url = f"https://yandex.com/images/search?url={quote_plus(self.image_url)}&rpt=imageview"
+        for label, url in result_links(self.image_url, sauce):
+            self.add_item(miru.Button(label=label, url=url))
 
-            urls = [
-                (lang('Sauce', 'google'), google_url),
-                (lang('Sauce', 'ascii2d'), ascii_url),
-                (lang('Sauce', 'yandex'), yandex_url)
-            ]
 
-            for label, url in urls:
-                self.add_item(miru.Button(label=label, url=url))
-            return
+def result_links(image_url: str, sauce: t.Optional[pysaucenao.GenericSource]) -> t.List[t.Tuple[str, str]]:
+    """
+    Gets the labels and URLs of the links to show with a result, or reverse image searches when there wasn't one
+    """
+    if not sauce:
+        google_url = f"https://lens.google.com/uploadbyurl?url={quote_plus(image_url)}&safe=off"
+        ascii_url = f"https://ascii2d.net/search/url/{quote_plus(image_url)}"
+        yandex_url = f"https://yandex.com/images/search?url={quote_plus(image_url)}&rpt=imageview"
+
+        return [
+            (lang('Sauce', 'google'), google_url),
+            (lang('Sauce', 'ascii2d'), ascii_url),
+            (lang('Sauce', 'yandex'), yandex_url)
+        ]
+
+    if isinstance(sauce, pysaucenao.AnimeSource):
+        urls = []
 
-        if isinstance(sauce, pysaucenao.AnimeSource):
-            urls = []
+        if sauce.anilist_url:
+            urls.append((lang('Sauce', 'anilist'), sauce.anilist_url))
 
-            if sauce.anilist_url:
-                urls.append((lang('Sauce', 'anilist'), sauce.anilist_url))
+        if sauce.mal_url:
+            urls.append((lang('Sauce', 'mal'), sauce.mal_url))
 
-            if sauce.mal_url:
-                urls.append((lang('Sauce', 'mal'), sauce.mal_url))
+        if sauce.anidb_url:
+            urls.append((lang('Sauce', 'anidb'), sauce.anidb_url))
 
-            if sauce.anidb_url:
-                urls.append((lang('Sauce', 'anidb'), sauce.anidb_url))
+        return urls
 
-            for label, url in urls:
-                self.add_item(miru.Button(label=label, url=url))
-        else:
-            self.add_item(miru.Button(label=sauce.index or "Unknown Source", url=sauce.url))
+    return [(sauce.index or "Unknown Source", sauce.url)]
@@ -17,6 +17,7 @@ class SelectTemplateView(miru.View):
         self.items      = items
         self.select     = None  # type: t.Optional[miru.TextSelect]
         self.selected   = None  # type: t.Optional[t.Union[hikari.Attachment, hikari.Embed]]
+        self.search_all = False
 
         super().__init__()
 
@@ -45,6 +46,14 @@ class SelectTemplateView(miru.View):
 
             index += 1
 
+        options.append(
+            miru.SelectOption(
+                label=lang('Sauce', 'search_all'),
+                value="all",
+                description=lang('Sauce', 'search_all_description')
+            )
+        )
+
         select = miru.TextSelect(
             placeholder=lang('Sauce', 'multiple_placeholder'),
             options=options
@@ -56,4 +65,9 @@ class SelectTemplateView(miru.View):
 
     async def select_callback(self, ctx: miru.ViewContext) -> None:
         log.debug(f"Image {self.select.values[0]} selected for searching", ctx.get_guild())
+        if self.select.values[0] == "all":
+            self.search_all = True
+            self.selected = self.items[0]
+            return
+
         self.selected = self.items[int(self.select.values[0])]
@@ -1,11 +1,13 @@
 import logging
+import typing as t
 
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import declarative_base
 
 from saucebot.components.config import config
 
-__all__ = ['async_engine', 'Base']
+__all__ = ['async_engine', 'Base', 'upsert']
 
 
 if config["bot"]["in_dev"]:
@@ -17,3 +19,22 @@ else:
 
 async_engine = create_async_engine(db_url, pool_recycle=300, pool_pre_ping=True)
 Base = declarative_base()
+
+
+def upsert(model, rows: t.List[dict], index_elements: t.List[str], set_: t.Callable[[t.Any], dict]):
+    """
+    Builds a multi-row INSERT that updates existing rows on a unique key conflict
+
+    set_ is passed the dialects reference to the inserted row values (VALUES() on MySQL, EXCLUDED elsewhere) and
+    should return the column values to update conflicting rows with
+    """
+    dialect = async_engine.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql.insert(model).values(rows)
+        return stmt.on_duplicate_key_update(**set_(stmt.inserted))
+
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(model).values(rows)
+        return stmt.on_conflict_do_update(index_elements=index_elements, set_=set_(stmt.excluded))
+
+    raise NotImplementedError(f"Upserts are not supported on the {dialect} dialect")
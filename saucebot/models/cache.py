@@ -0,0 +1,75 @@
+import time
+import typing as t
+
+from sqlalchemy import Column, BigInteger, String, Text, select, delete
+
+from saucebot.models import async_engine, Base, upsert
+
+__all__ = ['CacheEntries']
+
+
+class CacheEntries(Base):
+    __tablename__ = 'cache_entries'
+
+    key = Column(String(128), primary_key=True)
+    value = Column(Text, nullable=True)
+    expires_at = Column(BigInteger, index=True)
+
+    @classmethod
+    async def get(cls, key: str) -> t.Optional[t.Tuple[t.Optional[str], int]]:
+        """
+        Gets the serialized value and expiration timestamp of an unexpired cache entry
+        """
+        async with async_engine.connect() as conn:
+            result = await conn.execute(
+                select(CacheEntries.value, CacheEntries.expires_at)
+                .where(CacheEntries.key == key)
+                .where(CacheEntries.expires_at > int(time.time()))
+                .limit(1)
+            )
+
+            entry = result.fetchone()
+            if entry:
+                return entry.value, entry.expires_at
+
+    @classmethod
+    async def put_many(cls, entries: t.List[dict]) -> None:
+        """
+        Inserts or replaces a batch of {key, value, expires_at} cache entries in a single statement
+        """
+        if not entries:
+            return
+
+        async with async_engine.connect() as conn:
+            await conn.execute(
+                upsert(CacheEntries, entries, ['key'],
+                       lambda inserted: {'value': inserted.value, 'expires_at': inserted.expires_at})
+            )
+            await conn.commit()
+
+    @classmethod
+    async def recent(cls, prefix: str, limit: int) -> t.List[t.Tuple[str, t.Optional[str], int]]:
+        """
+        Gets the unexpired entries under the supplied key prefix with the longest remaining lifetimes
+        """
+        async with async_engine.connect() as conn:
+            result = await conn.execute(
+                select(CacheEntries.key, CacheEntries.value, CacheEntries.expires_at)
+                .where(CacheEntries.key.startswith(prefix))
+                .where(CacheEntries.expires_at > int(time.time()))
+                .order_by(CacheEntries.expires_at.desc())
+                .limit(limit)
+            )
+
+            return [(row.key, row.value, row.expires_at) for row in result.fetchall()]
+
+    @classmethod
+    async def purge_expired(cls) -> int:
+        async with async_engine.connect() as conn:
+            result = await conn.execute(
+                delete(CacheEntries)
+                .where(CacheEntries.expires_at <= int(time.time()))
+            )
+            await conn.commit()
+
+            return result.rowcount
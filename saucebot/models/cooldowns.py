@@ -0,0 +1,57 @@
+import time
+import typing as t
+
+from sqlalchemy import Column, BigInteger, Integer, String, select, delete
+
+from saucebot.models import async_engine, Base, upsert
+
+__all__ = ['Cooldowns']
+
+
+class Cooldowns(Base):
+    __tablename__ = 'cooldowns'
+
+    key = Column(String(128), primary_key=True)
+    uses = Column(Integer, nullable=False, default=0)
+    expires_at = Column(BigInteger, index=True)
+
+    @classmethod
+    async def add_many(cls, rows: t.List[dict]) -> None:
+        """
+        Atomically adds a batch of {key, uses, expires_at} usage counts to their cooldown windows
+        """
+        if not rows:
+            return
+
+        async with async_engine.connect() as conn:
+            await conn.execute(
+                upsert(Cooldowns, rows, ['key'], lambda inserted: {'uses': Cooldowns.uses + inserted.uses})
+            )
+            await conn.commit()
+
+    @classmethod
+    async def get_many(cls, keys: t.List[str]) -> t.Dict[str, int]:
+        """
+        Gets the number of uses recorded for each of the supplied cooldown windows
+        """
+        uses = {}
+        async with async_engine.connect() as conn:
+            for i in range(0, len(keys), 500):
+                result = await conn.execute(
+                    select(Cooldowns.key, Cooldowns.uses)
+                    .where(Cooldowns.key.in_(keys[i:i + 500]))
+                )
+                uses.update((row.key, row.uses) for row in result.fetchall())
+
+        return uses
+
+    @classmethod
+    async def purge_expired(cls) -> int:
+        async with async_engine.connect() as conn:
+            result = await conn.execute(
+                delete(Cooldowns)
+                .where(Cooldowns.expires_at <= int(time.time()))
+            )
+            await conn.commit()
+
+            return result.rowcount
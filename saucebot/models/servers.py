@@ -1,16 +1,20 @@
 import re
 import typing as t
+from collections import Counter
 
+import cachetools
 import hikari
 import pysaucenao.containers
 from pysaucenao import SauceNao
 from sqlalchemy import Column, BigInteger, String, select, insert, update, func
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from saucebot.components import log
-from saucebot.lang.lang import lang
-from saucebot.models import async_engine
+from saucebot.components import cluster, log
+from saucebot.components.config import config
+from saucebot.lang.lang import lang, languages
+from saucebot.models import async_engine, upsert
 
 Base = declarative_base()
 Session = sessionmaker()
@@ -19,6 +23,25 @@ Session = sessionmaker()
 api_re = re.compile(r"[a-z\d]{32}")
 
 
+class GuildSettings(t.NamedTuple):
+    api_key: t.Optional[str] = None
+    language: t.Optional[str] = None
+
+
+# Guilds without a servers entry are cached with the default settings, so they don't hit the database either
+DEFAULT_SETTINGS = GuildSettings()
+_settings_cache = cachetools.TTLCache(
+    maxsize=100000,
+    ttl=int(config.get("cache", {}).get("settings_ttl", 3600))
+)  # type: t.MutableMapping[int, GuildSettings]
+
+# Query counts that haven't been written to the database yet, by guild ID
+_pending_queries = Counter()  # type: t.Counter[int]
+
+# Running total of all queries ever processed, seeded from the database once and then kept up to date in memory
+_query_total = None  # type: t.Optional[int]
+
+
 class Servers(Base):
     __tablename__ = 'servers'
 
@@ -26,6 +49,7 @@ class Servers(Base):
     server_id = Column(BigInteger, unique=True)
     api_key = Column(String(40), nullable=True)
     queries = Column(BigInteger)
+    language = Column(String(32), nullable=True)
 
     @classmethod
     async def get_api_key(cls, guild) -> t.Optional[str]:
@@ -37,16 +61,49 @@ class Servers(Base):
         Returns:
             t.Optional[str]
         """
+        return (await cls.get_settings(guild.id)).api_key
+
+    @classmethod
+    async def get_settings(cls, guild_id: int) -> GuildSettings:
+        """
+        Gets the settings for the specified guild, only querying the database if they aren't already cached
+        """
+        if guild_id not in _settings_cache:
+            await cls.prefetch_settings([guild_id])
+
+        return _settings_cache.get(guild_id, DEFAULT_SETTINGS)
+
+    @classmethod
+    async def prefetch_settings(cls, guild_ids: t.Iterable[int]) -> None:
+        """
+        Loads the settings for a batch of guilds into the settings cache
+        """
+        guild_ids = [guild_id for guild_id in set(guild_ids) if guild_id not in _settings_cache]
+        if not guild_ids:
+            return
+
         async with async_engine.connect() as conn:
-            result = await conn.execute(
-                select(Servers)
-                .where(Servers.server_id == guild.id)
-                .limit(1)
-            )
+            for i in range(0, len(guild_ids), 500):
+                batch = guild_ids[i:i + 500]
+                result = await conn.execute(
+                    select(Servers.server_id, Servers.api_key, Servers.language)
+                    .where(Servers.server_id.in_(batch))
+                )
 
-            server = result.fetchone()
-            if server:
-                return server.api_key
+                found = {row.server_id: GuildSettings(api_key=row.api_key, language=row.language)
+                         for row in result.fetchall()}
+                for guild_id in batch:
+                    _settings_cache[guild_id] = found.get(guild_id, DEFAULT_SETTINGS)
+
+        log.debug(f"Prefetched settings for {len(guild_ids)} guilds")
+
+    @classmethod
+    def invalidate_settings(cls, guild_id: int) -> None:
+        """
+        Drops the cached settings for a guild, in this process and any other cluster workers
+        """
+        _settings_cache.pop(guild_id, None)
+        cluster.broadcast('invalidate_settings', guild_id=guild_id)
 
     @classmethod
     async def register(cls, guild: hikari.Guild, api_key: t.Optional[str]):
@@ -86,6 +143,7 @@ class Servers(Base):
                     .values(api_key=api_key)
                 )
                 await conn.commit()
+                cls.invalidate_settings(guild.id)
                 return
 
             # Insert
@@ -94,44 +152,96 @@ class Servers(Base):
                 .values(server_id=guild.id, api_key=api_key)
             )
             await conn.commit()
+            cls.invalidate_settings(guild.id)
             return
 
     @classmethod
-    async def log_query(cls, guild: t.Optional[hikari.Guild]):
-        guild_id = guild.id if guild else 0
+    async def set_language(cls, guild: hikari.Guild, language: str):
+        """
+        Sets the language the bot responds in for the specified guild
+        """
+        if language not in languages:
+            raise ValueError(lang("Settings", "bad_language", {'languages': ', '.join(languages)}))
 
-        # Update or create a new server entry
         async with async_engine.connect() as conn:
-            # Check for an existing entry
-            result = await conn.execute(
-                select(Servers)
-                .where(Servers.server_id == guild_id)
-                .limit(1)
+            await conn.execute(
+                upsert(Servers,
+                       [{'server_id': guild.id, 'language': language}],
+                       ['server_id'],
+                       lambda inserted: {'language': inserted.language})
             )
+            await conn.commit()
 
-            # Update
-            if result.fetchone():
+        cls.invalidate_settings(guild.id)
+
+    @classmethod
+    def log_query(cls, guild: t.Optional[hikari.Guild]):
+        """
+        Increments the query counter for a guild
+
+        Counts are only kept in memory here, and are written to the database in bulk by flush_queries()
+        """
+        global _query_total
+
+        _pending_queries[guild.id if guild else 0] += 1
+        if _query_total is not None:
+            _query_total += 1
+
+    @classmethod
+    async def flush_queries(cls):
+        """
+        Adds all pending query counts to their guilds with a single upsert
+        """
+        if not _pending_queries:
+            return
+
+        pending = dict(_pending_queries)
+        _pending_queries.clear()
+
+        try:
+            async with async_engine.connect() as conn:
                 await conn.execute(
-                    update(Servers)
-                    .where(Servers.server_id == guild_id)
-                    .values(queries=Servers.queries + 1)
+                    upsert(Servers,
+                           [{'server_id': guild_id, 'queries': count} for guild_id, count in pending.items()],
+                           ['server_id'],
+                           lambda inserted: {'queries': func.coalesce(Servers.queries, 0) + inserted.queries})
                 )
                 await conn.commit()
-                return
-
-            # Insert
-            await conn.execute(
-                insert(Servers)
-                .values(server_id=guild_id, queries=1)
-            )
-            await conn.commit()
+        except SQLAlchemyError:
+            log.exception(f"Failed to write query counts for {len(pending)} guilds, will retry")
+            _pending_queries.update(pending)
             return
 
+        log.debug(f"Wrote query counts for {len(pending)} guilds")
+
     @classmethod
     async def count_queries(cls) -> int:
+        """
+        Gets the total number of queries processed across all guilds
+
+        The total is only summed up from the database the first time it's needed (see load_query_total)
+        """
+        if _query_total is None:
+            await cls.load_query_total()
+
+        return _query_total
+
+    @classmethod
+    async def load_query_total(cls) -> None:
+        """
+        Seeds the running query total from the database
+        """
+        global _query_total
+
         async with async_engine.connect() as conn:
             result = await conn.execute(
                 select(func.sum(Servers.queries))
             )
 
-            return result.scalar()
+            # Anything we haven't flushed yet won't be in the database
+            _query_total = int(result.scalar() or 0) + sum(_pending_queries.values())
+
+
+@cluster.on('invalidate_settings')
+def _on_invalidate_settings(payload: dict) -> None:
+    _settings_cache.pop(payload['guild_id'], None)